@@ -6,21 +6,280 @@ Provides container management, system monitoring, and Claude Code endpoints.
 import asyncio
 import subprocess
 import json
+import logging
 import os
+import base64
+import codecs
+import email.utils
+import gzip
+import sqlite3
+import signal
+import threading
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from starlette.routing import Match
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import uuid
+import hashlib
+import heapq
+import html
+import mimetypes
+import re
+import shlex
 import shutil
+import time
+from collections import deque
+from contextlib import aclosing, asynccontextmanager, nullcontext
 import docker
 import psutil
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are served
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: without it telemetry endpoints only speak JSON
+    msgpack = None
+
+# Background task errors go to uvicorn's error log, alongside request errors
+logger = logging.getLogger("uvicorn.error")
+
+
+# ============ Serialization ============
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def json_default(value):
+    """Fallback for values neither encoder handles natively (sets, deques, models, ...)"""
+    if isinstance(value, (set, frozenset, deque)):
+        return list(value)
+    return jsonable_encoder(value)
+
+
+def json_bytes(value, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON, through orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(value, default=json_default, option=option)
+    return json.dumps(value, default=json_default, sort_keys=sort_keys, separators=(",", ":"),
+                      ensure_ascii=False).encode()
+
+
+def json_loads(data):
+    """Parse JSON from bytes or str, through orjson when it is installed.
+
+    Invalid input raises ValueError from either parser: a JSONDecodeError, or
+    UnicodeDecodeError for bytes that aren't UTF-8.
+    """
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: renders with json_bytes"""
+
+    def render(self, content) -> bytes:
+        return json_bytes(content)
+
+
+def sse_frame(data: bytes, event_id: Optional[int] = None) -> bytes:
+    """One SSE frame around a serialized JSON payload (which never contains a raw newline)"""
+    if event_id is None:
+        return b"data: " + data + b"\n\n"
+    return b"id: %d\ndata: %s\n\n" % (event_id, data)
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_TYPES)
+
+
+def msgpack_bytes(value) -> bytes:
+    return msgpack.packb(value, default=json_default)
+
+
+def encoded_response(request: Request, content, headers: Optional[dict] = None) -> Response:
+    """`content` as msgpack when the client asks for it (and msgpack is installed), else as JSON.
+
+    Returning a Response directly also skips FastAPI's jsonable_encoder pass.
+    """
+    headers = {"Vary": "Accept", **(headers or {})}
+    if wants_msgpack(request):
+        return Response(content=msgpack_bytes(content), media_type="application/msgpack", headers=headers)
+    return FastJSONResponse(content, headers=headers)
+
+
+# ============ Metrics ============
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event-loop lag probes
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "dgx_http_request_duration_seconds", "HTTP request latency by route; SSE streams until headers are sent",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+HTTP_IN_PROGRESS = Gauge(
+    "dgx_http_requests_in_progress", "Requests being handled, open streams included", ["method", "route"])
+STREAM_FIRST_EVENT_SECONDS = Histogram(
+    "dgx_stream_first_event_seconds", "Time from request to the first event of an SSE stream",
+    ["route"], buckets=LATENCY_BUCKETS)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "dgx_event_loop_lag_seconds", "How late the event loop woke a sleeping probe; long values are stalls",
+    buckets=LOOP_LAG_BUCKETS)
+SUBPROCESS_SPAWNS = Counter("dgx_subprocess_spawns_total", "Child processes started, by command", ["command"])
+SUBPROCESS_SPAWN_SECONDS = Histogram(
+    "dgx_subprocess_spawn_seconds", "Time to start a child process, by command", ["command"], buckets=LATENCY_BUCKETS)
+SUBPROCESS_SECONDS = Histogram(
+    "dgx_subprocess_duration_seconds", "Child process run time, by command", ["command"], buckets=DURATION_BUCKETS)
+DOCKER_CALL_SECONDS = Histogram(
+    "dgx_docker_call_duration_seconds", "Docker API request latency; streaming calls until headers arrive",
+    ["method", "endpoint"], buckets=LATENCY_BUCKETS)
+AGENT_RUN_SECONDS = Histogram(
+    "dgx_agent_run_duration_seconds", "Agent run duration", ["agent", "outcome"], buckets=DURATION_BUCKETS)
+AGENT_FIRST_OUTPUT_SECONDS = Histogram(
+    "dgx_agent_first_output_seconds", "Time from the start of an agent run to its first output",
+    ["agent"], buckets=DURATION_BUCKETS)
+TELEMETRY_COLLECTOR_SECONDS = Histogram(
+    "dgx_telemetry_collector_seconds", "Time taken by each telemetry collector per sample",
+    ["collector"], buckets=LATENCY_BUCKETS)
+PROCESS_SCAN_SECONDS = Histogram(
+    "dgx_process_scan_seconds", "Time taken by one ProcessTracker.update pass over all processes",
+    buckets=LATENCY_BUCKETS)
+UPLOAD_BYTES = Counter("dgx_upload_bytes_total", "Upload bytes received", ["mode"])
+UPLOAD_THROUGHPUT = Histogram(
+    "dgx_upload_throughput_bytes_per_second", "Receive rate of each upload request", ["mode"],
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6))
+
+# Path segments after these Docker API collections are object ids or names
+DOCKER_API_COLLECTIONS = {"containers", "images", "networks", "volumes", "exec", "plugins"}
+DOCKER_API_ACTIONS = {"json", "create", "prune", "search", "load", "get"}
+
+
+class MetricsMiddleware:
+    """Records latency and in-flight requests per route template, and SSE time-to-first-event.
+
+    A plain ASGI middleware, so streaming responses pass through untouched.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def route_label(self, scope) -> str:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        method = scope["method"]
+        route = self.route_label(scope)
+        response = {"status": "500", "stream": False, "first_event": True}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = str(message["status"])
+                response["stream"] = any(
+                    key == b"content-type" and value.startswith(b"text/event-stream")
+                    for key, value in message.get("headers", [])
+                )
+                if response["stream"]:
+                    HTTP_REQUEST_SECONDS.labels(method, route, response["status"]).observe(time.perf_counter() - start)
+            elif response["stream"] and response["first_event"]:
+                body = message.get("body", b"")
+                if body and not body.startswith(b":"):  # Comments are keepalives, not events
+                    response["first_event"] = False
+                    STREAM_FIRST_EVENT_SECONDS.labels(route).observe(time.perf_counter() - start)
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            in_progress.dec()
+            if not response["stream"]:
+                HTTP_REQUEST_SECONDS.labels(method, route, response["status"]).observe(time.perf_counter() - start)
+
+
+def docker_endpoint(path: str) -> str:
+    """A Docker API path without its version prefix or object ids, e.g. /containers/{id}/stats"""
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    if parts and re.fullmatch(r"v[\d.]+", parts[0]):
+        parts = parts[1:]
+    for i in range(1, len(parts)):
+        if parts[i - 1] in DOCKER_API_COLLECTIONS and parts[i] not in DOCKER_API_ACTIONS:
+            parts[i] = "{id}"
+    return "/" + "/".join(parts)
+
+
+def instrument_docker_client(docker_client):
+    """Time every request the Docker SDK client sends (the SDK is a requests.Session underneath)"""
+    api = getattr(docker_client, "api", None)
+    if api is None or not hasattr(api, "send"):
+        return
+    send = api.send
+
+    def timed_send(request, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send(request, **kwargs)
+        finally:
+            DOCKER_CALL_SECONDS.labels(request.method, docker_endpoint(request.path_url)).observe(
+                time.perf_counter() - start)
+
+    api.send = timed_send
+
+
+def command_label(cmd, shell: bool = False) -> str:
+    """The program name of a command, as a low-cardinality metric label"""
+    program = (cmd.split(None, 1) or [""])[0] if shell else cmd[0]
+    return os.path.basename(program)
+
+
+def observe_subprocess(cmd, seconds: float, shell: bool = False):
+    SUBPROCESS_SECONDS.labels(command_label(cmd, shell)).observe(seconds)
+
+
+def observe_upload(mode: str, size: int, seconds: float):
+    UPLOAD_BYTES.labels(mode).inc(size)
+    if size and seconds > 0:
+        UPLOAD_THROUGHPUT.labels(mode).observe(size / seconds)
+
+
+async def probe_event_loop_lag():
+    """Sleep in a loop and record how late each wakeup is; anything blocking the loop shows up here"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG_SECONDS.observe(max(loop.time() - start - LOOP_LAG_INTERVAL, 0))
+
 
 app = FastAPI(
     title="DGX Management API",
     description="Backend API for managing DGX services",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS for frontend
@@ -31,9 +290,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, router=app.router)
 
 # Docker client - connects via mounted socket
 client = docker.from_env()
+instrument_docker_client(client)
 
 # Known service containers
 MANAGED_SERVICES = {
@@ -90,7 +351,11 @@ GOOSE_PATH = os.path.expanduser("~/.local/bin/goose")
 GOOSE_RESEARCH_DIR = os.path.expanduser("~/goose-research")
 GOOSE_DATA_DIR = os.path.expanduser("~/goose-research/data")
 
-# Session storage files
+# SQLite database for sessions and other backend state
+DATABASE_FILE = os.path.expanduser("~/.dgx-web-ui.db")
+PAGE_LIMIT_MAX = 1000  # Largest page a list endpoint returns
+
+# Legacy JSON session files, imported into the database once
 SESSIONS_FILE = os.path.expanduser("~/.dgx-web-ui-sessions.json")
 
 # Rick agent path and sessions (Family Assistant using agent-rick)
@@ -104,26 +369,668 @@ UPLOAD_DIRS = {
     "sparky": os.path.expanduser("~/agent-sparky/uploads"),
 }
 
+# Partial uploads are staged here (same filesystem as UPLOAD_DIRS) until complete
+UPLOAD_STAGING_DIR = os.path.expanduser("~/.dgx-web-ui-uploads")
+
 # Ensure upload directories exist
-for upload_dir in UPLOAD_DIRS.values():
+for upload_dir in [*UPLOAD_DIRS.values(), UPLOAD_STAGING_DIR]:
     os.makedirs(upload_dir, exist_ok=True)
 
 
-def load_sessions() -> dict:
-    """Load saved sessions from JSON file"""
-    if os.path.exists(SESSIONS_FILE):
+class Database:
+    """Shared SQLite connection in WAL mode.
+
+    One connection guarded by a lock; callers on the event loop go through
+    asyncio.to_thread. Each subsystem creates its own tables via add_schema().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self._conn = None
+        self._schemas = []
+
+    def add_schema(self, fn):
+        """Register fn(conn) to create tables the first time the database is opened"""
+        self._schemas.append(fn)
+        if self._conn is not None:
+            with self.lock:
+                fn(self._conn)
+        return fn
+
+    def connect(self) -> sqlite3.Connection:
+        with self.lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                for fn in self._schemas:
+                    fn(conn)
+                self._conn = conn
+            return self._conn
+
+
+database = Database(DATABASE_FILE)
+
+
+@database.add_schema
+def create_session_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            agent TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            first_message TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (agent, session_id)
+        );
+        CREATE INDEX IF NOT EXISTS sessions_by_updated ON sessions (agent, updated_at DESC, session_id DESC);
+    """)
+    conn.commit()
+
+
+class SessionStore:
+    """Saved agent sessions, namespaced by agent, in the shared database"""
+
+    def __init__(self, db: Database, legacy_files: dict):
+        self.db = db
+        self.legacy_files = legacy_files  # agent -> JSON file imported on first use
+        self._imported = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = self.db.connect()
+        if not self._imported:
+            self._import_legacy(conn)
+            self._imported = True
+        return conn
+
+    def _import_legacy(self, conn):
+        for agent, path in self.legacy_files.items():
+            key = f"sessions_imported:{agent}"
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                continue
+            sessions = []
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r') as f:
+                        sessions = json.load(f).get("sessions", [])
+                except (json.JSONDecodeError, IOError):
+                    sessions = []
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (agent, s["session_id"], s.get("name", ""), s.get("first_message") or "",
+                         s.get("created_at", ""), s.get("updated_at") or s.get("created_at", ""))
+                        for s in sessions if s.get("session_id")
+                    ]
+                )
+                conn.execute("INSERT INTO meta VALUES (?, ?)", (key, path))
+
+    @staticmethod
+    def encode_cursor(row) -> str:
+        return base64.urlsafe_b64encode(f"{row['updated_at']}|{row['session_id']}".encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            updated_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+        return updated_at, session_id
+
+    def list(self, agent: str, limit: Optional[int] = None, cursor: Optional[str] = None) -> dict:
+        """Sessions newest first; `cursor` continues from a previous page's next_cursor"""
+        query = "SELECT session_id, name, first_message, created_at, updated_at FROM sessions WHERE agent = ?"
+        params = [agent]
+        if cursor:
+            query += " AND (updated_at, session_id) < (?, ?)"
+            params.extend(self.decode_cursor(cursor))
+        query += " ORDER BY updated_at DESC, session_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.db.lock:
+            rows = self._conn().execute(query, params).fetchall()
+        next_cursor = self.encode_cursor(rows[-1]) if rows and limit is not None and len(rows) == limit else None
+        return {"sessions": [dict(row) for row in rows], "next_cursor": next_cursor}
+
+    def save(self, agent: str, session_id: str, name: str, first_message: Optional[str] = None):
+        """Insert a session, or rename/touch it keeping its first message unless a new one is given"""
+        from datetime import datetime
+        now = datetime.now().isoformat()
+        with self.db.lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (agent, session_id) DO UPDATE SET
+                        name = excluded.name,
+                        updated_at = excluded.updated_at,
+                        first_message = CASE WHEN excluded.first_message != ''
+                            THEN excluded.first_message ELSE sessions.first_message END
+                    """,
+                    (agent, session_id, name, first_message or "", now, now)
+                )
+
+    def delete(self, agent: str, session_id: str) -> bool:
+        with self.db.lock:
+            conn = self._conn()
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM sessions WHERE agent = ? AND session_id = ?", (agent, session_id)
+                )
+        return cursor.rowcount > 0
+
+
+session_store = SessionStore(database, {"sparky": SESSIONS_FILE, "rick": RICK_SESSIONS_FILE})
+
+
+# ============ File Catalog ============
+
+CATALOG_CHECK_INTERVAL = 2  # Seconds between directory mtime checks
+CATALOG_RESCAN_INTERVAL = 60  # Seconds between full rescans, which catch files edited in place
+SEARCH_MAX_DOCUMENT = 2 * 1024 * 1024  # Bytes of each file that are full-text indexed
+SEARCH_HIGHLIGHT = ("\x02", "\x03")  # Match markers, swapped for <mark> after escaping
+CATALOG_SORT_COLUMNS = {"modified": "mtime", "name": "name", "size": "size"}
+
+
+@database.add_schema
+def create_catalog_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS file_catalog (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha256 TEXT,
+            mime TEXT,
+            PRIMARY KEY (directory, name)
+        );
+        CREATE INDEX IF NOT EXISTS file_catalog_by_mtime ON file_catalog (directory, mtime DESC);
+        CREATE INDEX IF NOT EXISTS file_catalog_by_size ON file_catalog (directory, size);
+        CREATE TABLE IF NOT EXISTS catalog_dirs (
+            directory TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL
+        );
+    """)
+    conn.commit()
+
+
+@database.add_schema
+def create_search_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY,
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (directory, name)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, body, tokenize='porter unicode61');
+    """)
+    conn.commit()
+
+
+def fts_query(text: str) -> str:
+    """Quote each word so input is matched literally, not parsed as FTS5 syntax; the last word matches as a prefix"""
+    terms = ['"%s"' % term.replace('"', '""') for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def highlight_html(text: str) -> str:
+    """HTML-escape an FTS5 snippet, then turn its match markers into <mark> tags"""
+    start, end = SEARCH_HIGHLIGHT
+    return html.escape(text).replace(start, "<mark>").replace(end, "</mark>")
+
+
+def document_title(name: str, body: str) -> str:
+    """The first markdown heading, else the file name without its extension"""
+    for line in body.splitlines()[:50]:
+        if line.startswith("#"):
+            title = line.lstrip("#").strip()
+            if title:
+                return title
+    return os.path.splitext(name)[0]
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileCatalog:
+    """Indexed listing of one directory's files, kept in the shared database.
+
+    Listing is a database query. The directory is rescanned only when its
+    mtime changes (checked at most every CATALOG_CHECK_INTERVAL seconds, with
+    a full rescan every CATALOG_RESCAN_INTERVAL), and then only new or
+    changed files are hashed. With `fulltext`, the same changes keep an FTS5
+    index of file contents up to date. Blocking; call via to_thread.
+    """
+
+    def __init__(self, db: Database, directory: str, suffix: Optional[str] = None, fulltext: bool = False):
+        self.db = db
+        self.directory = directory
+        self.suffix = suffix  # Only catalog names ending with this
+        self.fulltext = fulltext
+        self._checked_at = 0.0
+        self._rescanned_at = 0.0
+        self._scan_lock = threading.Lock()
+
+    def _wanted(self, name: str) -> bool:
+        return not name.startswith('.') and (self.suffix is None or name.endswith(self.suffix))
+
+    def _entry(self, name: str, stat, sha256: Optional[str] = None) -> tuple:
+        path = os.path.join(self.directory, name)
+        return (self.directory, name, stat.st_size, stat.st_mtime,
+                sha256 or hash_file(path), mimetypes.guess_type(name)[0] or "application/octet-stream")
+
+    def sync(self, force: bool = False):
+        """Bring the index up to date with the directory if it has changed"""
+        now = time.time()
+        if not force and now - self._checked_at < CATALOG_CHECK_INTERVAL:
+            return
+        with self._scan_lock:
+            self._checked_at = now
+            try:
+                dir_mtime = os.stat(self.directory).st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = 0
+            if now - self._rescanned_at >= CATALOG_RESCAN_INTERVAL:
+                force = True
+                self._rescanned_at = now
+            with self.db.lock:
+                conn = self.db.connect()
+                row = conn.execute("SELECT mtime_ns FROM catalog_dirs WHERE directory = ?", (self.directory,)).fetchone()
+                if row is not None and row["mtime_ns"] == dir_mtime and not force:
+                    return
+                known = {
+                    r["name"]: (r["size"], r["mtime"])
+                    for r in conn.execute("SELECT name, size, mtime FROM file_catalog WHERE directory = ?", (self.directory,))
+                }
+                unindexed = set()
+                if self.fulltext:
+                    unindexed = set(known) - {
+                        r["name"] for r in conn.execute("SELECT name FROM search_docs WHERE directory = ?", (self.directory,))
+                    }
+            # Scan, hash and read outside the database lock
+            changed, documents, present = [], [], set()
+            if dir_mtime:
+                with os.scandir(self.directory) as entries:
+                    for entry in entries:
+                        if not self._wanted(entry.name) or not entry.is_file():
+                            continue
+                        present.add(entry.name)
+                        stat = entry.stat()
+                        if entry.name in unindexed or known.get(entry.name) != (stat.st_size, stat.st_mtime):
+                            try:
+                                changed.append(self._entry(entry.name, stat))
+                                if self.fulltext:
+                                    documents.append(self._document(entry.name))
+                            except OSError:
+                                present.discard(entry.name)
+            removed = [(self.directory, name) for name in known if name not in present]
+            with self.db.lock:
+                conn = self.db.connect()
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO file_catalog VALUES (?, ?, ?, ?, ?, ?)", changed)
+                    conn.executemany("DELETE FROM file_catalog WHERE directory = ? AND name = ?", removed)
+                    conn.execute("INSERT OR REPLACE INTO catalog_dirs VALUES (?, ?)", (self.directory, dir_mtime))
+                    if self.fulltext:
+                        for _, name in removed:
+                            self._unindex(conn, name)
+                        for document in documents:
+                            self._index(conn, *document)
+
+    def _document(self, name: str) -> tuple:
+        with open(os.path.join(self.directory, name), 'r', encoding='utf-8', errors='replace') as f:
+            body = f.read(SEARCH_MAX_DOCUMENT)
+        return name, document_title(name, body), body
+
+    def _unindex(self, conn, name: str):
+        row = conn.execute("SELECT id FROM search_docs WHERE directory = ? AND name = ?",
+                           (self.directory, name)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM search_fts WHERE rowid = ?", (row["id"],))
+            conn.execute("DELETE FROM search_docs WHERE id = ?", (row["id"],))
+
+    def _index(self, conn, name: str, title: str, body: str):
+        self._unindex(conn, name)
+        doc_id = conn.execute("INSERT INTO search_docs (directory, name) VALUES (?, ?)",
+                              (self.directory, name)).lastrowid
+        conn.execute("INSERT INTO search_fts (rowid, title, body) VALUES (?, ?, ?)", (doc_id, title, body))
+
+    def record(self, name: str, sha256: Optional[str] = None):
+        """Index a file we just wrote, without waiting for the next rescan"""
+        if not self._wanted(name):
+            return
+        entry = self._entry(name, os.stat(os.path.join(self.directory, name)), sha256)
+        document = self._document(name) if self.fulltext else None
+        with self.db.lock:
+            conn = self.db.connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO file_catalog VALUES (?, ?, ?, ?, ?, ?)", entry)
+                if document is not None:
+                    self._index(conn, *document)
+
+    def forget(self, name: str):
+        with self.db.lock:
+            conn = self.db.connect()
+            with conn:
+                conn.execute("DELETE FROM file_catalog WHERE directory = ? AND name = ?", (self.directory, name))
+                if self.fulltext:
+                    self._unindex(conn, name)
+
+    def list(self, sort: str = "modified", descending: bool = True, prefix: Optional[str] = None,
+             limit: Optional[int] = None, offset: int = 0) -> dict:
+        """Files sorted by modified/name/size, optionally by name prefix, one page at a time"""
+        if sort not in CATALOG_SORT_COLUMNS:
+            raise ValueError(f"Invalid sort: {sort}. Valid: {list(CATALOG_SORT_COLUMNS)}")
+        self.sync()
+        where = "directory = ?"
+        params = [self.directory]
+        if prefix:
+            # Range scan on the primary key rather than LIKE, which would need escaping
+            where += " AND name >= ? AND name < ?"
+            params.extend([prefix, prefix + "\U0010ffff"])
+        column = CATALOG_SORT_COLUMNS[sort]
+        direction = "DESC" if descending else "ASC"
+        query = (f"SELECT name, size, mtime, sha256, mime FROM file_catalog WHERE {where} "
+                 f"ORDER BY {column} {direction}, name {direction} LIMIT ? OFFSET ?")
+        with self.db.lock:
+            conn = self.db.connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM file_catalog WHERE {where}", params).fetchone()[0]
+            rows = conn.execute(query, [*params, -1 if limit is None else limit, offset]).fetchall()
+        return {"files": [dict(row) for row in rows], "total": total}
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> dict:
+        """Full-text matches, best first, with highlighted titles and snippets as escaped HTML"""
+        if not self.fulltext:
+            raise ValueError("This catalog has no full-text index")
+        query = fts_query(text)
+        if not query:
+            raise ValueError("Empty search query")
+        self.sync()
+        start, end = SEARCH_HIGHLIGHT
+        with self.db.lock:
+            conn = self.db.connect()
+            total = conn.execute(
+                "SELECT COUNT(*) FROM search_fts JOIN search_docs d ON d.id = search_fts.rowid "
+                "WHERE search_fts MATCH ? AND d.directory = ?",
+                (query, self.directory)
+            ).fetchone()[0]
+            rows = conn.execute(
+                """
+                SELECT d.name, f.size, f.mtime,
+                       highlight(search_fts, 0, ?, ?) AS title,
+                       snippet(search_fts, 1, ?, ?, '…', 24) AS snippet,
+                       bm25(search_fts, 5.0, 1.0) AS rank
+                FROM search_fts
+                JOIN search_docs d ON d.id = search_fts.rowid
+                JOIN file_catalog f ON f.directory = d.directory AND f.name = d.name
+                WHERE search_fts MATCH ? AND d.directory = ?
+                ORDER BY rank LIMIT ? OFFSET ?
+                """,
+                (start, end, start, end, query, self.directory, limit, offset)
+            ).fetchall()
+        results = [
+            {**dict(row), "title": highlight_html(row["title"]), "snippet": highlight_html(row["snippet"])}
+            for row in rows
+        ]
+        return {"results": results, "total": total}
+
+
+upload_catalogs = {agent: FileCatalog(database, path) for agent, path in UPLOAD_DIRS.items()}
+research_catalog = FileCatalog(database, GOOSE_DATA_DIR, suffix=".md", fulltext=True)
+
+
+async def list_agent_sessions(agent: str, limit: Optional[int], cursor: Optional[str]) -> dict:
+    try:
+        return await asyncio.to_thread(session_store.list, agent, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def save_agent_session(agent: str, request: SaveSessionRequest) -> dict:
+    await asyncio.to_thread(
+        session_store.save, agent, request.session_id, request.name, request.first_message
+    )
+    return {"success": True, "session_id": request.session_id}
+
+
+async def delete_agent_session(agent: str, session_id: str) -> dict:
+    if not await asyncio.to_thread(session_store.delete, agent, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"success": True, "deleted": session_id}
+
+
+# ============ File Serving ============
+
+FILE_VARIANT_DIR = os.path.expanduser("~/.dgx-web-ui-variants")  # Compressed copies of served text files
+FILE_COMPRESS_MIN = 1024  # Smaller files are served as-is
+FILE_COMPRESS_MAX = 32 * 1024 * 1024  # Larger files are not compressed on demand
+COMPRESSIBLE_TYPES = {"application/json", "application/javascript", "application/xml", "image/svg+xml"}
+FILE_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # In order of preference
+
+
+def resolve_served_file(directory: str, filename: str) -> str:
+    """Path of a visible regular file directly inside `directory`, else 403/404"""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(directory, filename))
+    if filename.startswith('.') or os.path.dirname(path) != root:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return path
+
+
+def compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings the client accepts, from Accept-Encoding (q=0 excluded)"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compressed_variant(path: str, stat, encoding: str, suffix: str) -> Optional[str]:
+    """A compressed copy of `path` for this size and mtime, created on first use.
+
+    Copies are keyed by the file's validators, so an edited file gets a new
+    one and its old copies are removed. Blocking; call via to_thread.
+    """
+    if encoding == "br" and brotli is None:
+        return None
+    key = hashlib.sha256(path.encode()).hexdigest()[:24]
+    variant = os.path.join(FILE_VARIANT_DIR, f"{key}-{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}")
+    if os.path.exists(variant):
+        return variant
+    os.makedirs(FILE_VARIANT_DIR, exist_ok=True)
+    with open(path, 'rb') as f:
+        data = f.read()
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=9)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data):
+        return None
+    tmp = f"{variant}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp, variant)
+    for name in os.listdir(FILE_VARIANT_DIR):
+        if name.startswith(key + "-") and name.endswith(suffix) and os.path.join(FILE_VARIANT_DIR, name) != variant:
+            try:
+                os.remove(os.path.join(FILE_VARIANT_DIR, name))
+            except FileNotFoundError:
+                pass
+    return variant
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """True when the client's cached copy (If-None-Match, else If-Modified-Since) is current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
         try:
-            with open(SESSIONS_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {"sessions": []}
-    return {"sessions": []}
+            return int(mtime) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def serve_file(request: Request, path: str, media_type: Optional[str] = None,
+                     download: bool = False) -> Response:
+    """Stream a file from disk with Range, ETag/Last-Modified revalidation and compressed variants.
+
+    The body goes out through FileResponse (sendfile/pathsend where the
+    server supports it), which also answers Range and If-Range. Text files
+    are sent as a cached gzip or brotli copy when the client accepts one and
+    no range was asked for.
+    """
+    try:
+        stat = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    validator = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    headers = {
+        "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",  # Always revalidate; unchanged files cost a 304
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    body_path, encoding = path, None
+    if compressible(media_type):
+        headers["Vary"] = "Accept-Encoding"
+        if "range" not in request.headers and FILE_COMPRESS_MIN <= stat.st_size <= FILE_COMPRESS_MAX:
+            accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+            for coding, suffix in FILE_ENCODINGS:
+                if coding in accepted:
+                    variant = await asyncio.to_thread(compressed_variant, path, stat, coding, suffix)
+                    if variant is not None:
+                        body_path, encoding = variant, coding
+                        break
+    # Each encoding is its own representation, so it gets its own entity tag
+    headers["ETag"] = f'"{validator}-{encoding}"' if encoding else f'"{validator}"'
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if not_modified(request, headers["ETag"], stat.st_mtime):
+        headers.pop("X-Content-Type-Options")
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        body_path, media_type=media_type, headers=headers,
+        filename=os.path.basename(path) if download else None,
+        content_disposition_type="attachment" if download else "inline",
+    )
+
 
+# ============ Async Command Runner ============
 
-def save_sessions(data: dict):
-    """Save sessions to JSON file"""
-    with open(SESSIONS_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+# Max concurrent child processes started by request handlers. Excess callers
+# wait for a slot instead of forking unbounded work onto the host. Agent CLIs
+# skip these slots: the agent scheduler caps them, and a long agent run must
+# not hold a slot that short status probes are waiting on.
+COMMAND_CONCURRENCY = int(os.environ.get("COMMAND_CONCURRENCY", "8"))
+_command_slots = asyncio.Semaphore(COMMAND_CONCURRENCY)
+
+
+def kill_process_group(process):
+    """SIGKILL a child started with start_new_session=True, including its children"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def spawn_process(cmd, shell: bool = False, **kwargs):
+    """asyncio.create_subprocess_exec (or _shell), counted and timed by command"""
+    start = time.perf_counter()
+    if shell:
+        process = await asyncio.create_subprocess_shell(cmd, **kwargs)
+    else:
+        process = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+    label = command_label(cmd, shell)
+    SUBPROCESS_SPAWNS.labels(label).inc()
+    SUBPROCESS_SPAWN_SECONDS.labels(label).observe(time.perf_counter() - start)
+    return process
+
+
+def run_process_sync(cmd, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run for worker threads (telemetry collectors), counted and timed like spawn_process"""
+    start = time.perf_counter()
+    spawned = True
+    try:
+        return subprocess.run(cmd, **kwargs)
+    except FileNotFoundError:
+        spawned = False  # Missing binary, nothing was started
+        raise
+    finally:
+        if spawned:
+            SUBPROCESS_SPAWNS.labels(command_label(cmd)).inc()
+            observe_subprocess(cmd, time.perf_counter() - start)
+
+
+async def run_command(cmd, timeout: float, cwd: Optional[str] = None, env: Optional[dict] = None,
+                      shell: bool = False, limited: bool = True) -> subprocess.CompletedProcess:
+    """Run a command without blocking the event loop.
+
+    Behaves like subprocess.run(capture_output=True, text=True): raises
+    subprocess.TimeoutExpired on timeout and FileNotFoundError for a missing
+    binary. The child's process group is killed on timeout or if the caller
+    is cancelled. limited=False skips _command_slots, for agent launches that
+    already hold an agent scheduler slot.
+    """
+    async with _command_slots if limited else nullcontext():
+        start = time.perf_counter()
+        process = await spawn_process(
+            cmd, shell=shell, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            cwd=cwd, env=env, start_new_session=True
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            kill_process_group(process)
+            await process.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            kill_process_group(process)
+            raise
+        finally:
+            observe_subprocess(cmd, time.perf_counter() - start, shell)
+
+    return subprocess.CompletedProcess(
+        cmd, process.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+    )
 
 
 # ============ Health & Info ============
@@ -134,15 +1041,47 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.on_event("startup")
+async def start_event_loop_probe():
+    app.state.loop_probe = asyncio.create_task(probe_event_loop_lag())
+
+
+@app.on_event("shutdown")
+async def stop_event_loop_probe():
+    app.state.loop_probe.cancel()
+
+
+# Host facts from the Docker daemon rarely change; container counts come from the
+# container cache, so /api/info only calls Docker once per DOCKER_INFO_TTL.
+DOCKER_INFO_TTL = 300
+_docker_info = {"fetched_at": 0.0, "info": None, "version": None}
+
+
+def fetch_docker_info():
+    _docker_info["info"] = client.info()
+    _docker_info["version"] = client.version()
+    _docker_info["fetched_at"] = time.time()
+
+
 @app.get("/api/info")
 async def get_info():
     """Get Docker and system info"""
     try:
-        info = client.info()
+        if time.time() - _docker_info["fetched_at"] > DOCKER_INFO_TTL:
+            await asyncio.to_thread(fetch_docker_info)
+        info = _docker_info["info"]
+        cache = await cached_containers()
+        containers = cache.list(all=True)
         return {
-            "docker_version": client.version()["Version"],
-            "containers_running": info["ContainersRunning"],
-            "containers_total": info["Containers"],
+            "docker_version": _docker_info["version"]["Version"],
+            "containers_running": sum(1 for c in containers if c["status"] == "running"),
+            "containers_total": len(containers),
             "images": info["Images"],
             "memory_total_gb": round(info["MemTotal"] / (1024**3), 1),
             "cpus": info["NCPU"],
@@ -155,28 +1094,182 @@ async def get_info():
 
 # ============ Container Management ============
 
+# Docker events that change what the container cache reports
+CONTAINER_STATE_EVENTS = {
+    "create", "start", "restart", "stop", "die", "kill", "pause", "unpause",
+    "rename", "update", "oom", "health_status", "destroy",
+}
+
+
+def find_service_name(container_name: str) -> Optional[str]:
+    """Managed service name for a container, if it is one"""
+    for name, info in MANAGED_SERVICES.items():
+        if info["container"] in container_name:
+            return name
+    return None
+
+
+def summarize_container(c) -> dict:
+    """Snapshot of a container's API-facing fields, taken from its attrs"""
+    image = (c.attrs.get("Config") or {}).get("Image") or c.attrs.get("Image", "")[:17]
+    return {
+        "id": c.short_id,
+        "full_id": c.id,
+        "name": c.name,
+        "status": c.status,
+        "image": image,
+        "service": find_service_name(c.name),
+        "ports": c.ports,
+        "created": c.attrs.get("Created"),
+        "state": c.attrs.get("State"),
+    }
+
+
+class ContainerStateCache:
+    """In-memory container state kept current by the Docker events stream.
+
+    Loads once with a single containers.list(all=True), then a background thread
+    consumes client.events() and refreshes only the containers that changed, so
+    read endpoints make no Docker API calls in steady state.
+    """
+
+    def __init__(self, docker_client):
+        self.client = docker_client
+        self.containers = {}  # name -> summary
+        self.loaded = False
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+        self._events = None
+        self._thread = None
+        self._stopping = False
+
+    def load(self):
+        summaries = {c.name: summarize_container(c) for c in self.client.containers.list(all=True)}
+        with self._lock:
+            self.containers = summaries
+            self.loaded = True
+            self.updated_at = time.time()
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def refresh(self, name_or_id: str):
+        """Re-read one container after an event or an action we performed"""
+        try:
+            summary = summarize_container(self.client.containers.get(name_or_id))
+        except docker.errors.NotFound:
+            self._remove(name_or_id)
+            return
+        with self._lock:
+            # Drop the old entry if the container was renamed
+            for name, existing in list(self.containers.items()):
+                if existing["full_id"] == summary["full_id"] and name != summary["name"]:
+                    del self.containers[name]
+            self.containers[summary["name"]] = summary
+            self.updated_at = time.time()
+
+    def _remove(self, name_or_id: str):
+        with self._lock:
+            for name, existing in list(self.containers.items()):
+                if name == name_or_id or existing["full_id"].startswith(name_or_id):
+                    del self.containers[name]
+                    self.updated_at = time.time()
+
+    def handle_event(self, event: dict):
+        action = (event.get("Action") or event.get("status") or "").split(":")[0]
+        if action not in CONTAINER_STATE_EVENTS:
+            return
+        container_id = (event.get("Actor") or {}).get("ID") or event.get("id")
+        if not container_id:
+            return
+        if action == "destroy":
+            self._remove(container_id)
+        else:
+            self.refresh(container_id)
+
+    def _watch(self):
+        while not self._stopping:
+            try:
+                self._events = self.client.events(decode=True, filters={"type": "container"})
+                # (Re)load after subscribing so no change between the two is missed
+                self.load()
+                for event in self._events:
+                    self.handle_event(event)
+            except Exception:
+                # stop() closing the stream also lands here; only real failures are logged
+                if not self._stopping:
+                    logger.exception("Docker events watch failed; retrying")
+            if not self._stopping:
+                time.sleep(5)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="docker-events", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        if self._events is not None:
+            try:
+                self._events.close()
+            except Exception:
+                pass
+
+    def list(self, all: bool = False) -> list:
+        with self._lock:
+            containers = list(self.containers.values())
+        if not all:
+            containers = [c for c in containers if c["status"] == "running"]
+        return containers
+
+    def get(self, name_or_id: str) -> Optional[dict]:
+        with self._lock:
+            if name_or_id in self.containers:
+                return self.containers[name_or_id]
+            for summary in self.containers.values():
+                if summary["full_id"].startswith(name_or_id):
+                    return summary
+        return None
+
+
+container_cache = ContainerStateCache(client)
+
+
+@app.on_event("startup")
+async def start_container_cache():
+    container_cache.start()
+
+
+@app.on_event("shutdown")
+async def stop_container_cache():
+    container_cache.stop()
+
+
+async def cached_containers() -> ContainerStateCache:
+    """The container cache, loading it on first use if the watcher hasn't yet"""
+    if not container_cache.loaded:
+        await asyncio.to_thread(container_cache.ensure_loaded)
+    return container_cache
+
+
+def container_status(container_name: str) -> str:
+    """Cached status for a container, 'not found' if it doesn't exist"""
+    if not container_cache.loaded:
+        return "error"
+    summary = container_cache.get(container_name)
+    return summary["status"] if summary else "not found"
+
+
 @app.get("/api/containers")
 async def list_containers(all: bool = False):
     """List all containers with status"""
     try:
-        containers = client.containers.list(all=all)
-        result = []
-        for c in containers:
-            # Find if it's a managed service
-            service_name = None
-            for name, info in MANAGED_SERVICES.items():
-                if info["container"] in c.name:
-                    service_name = name
-                    break
-
-            result.append({
-                "id": c.short_id,
-                "name": c.name,
-                "status": c.status,
-                "image": c.image.tags[0] if c.image.tags else c.image.short_id,
-                "service": service_name,
-                "ports": c.ports,
-            })
+        cache = await cached_containers()
+        result = [
+            {key: c[key] for key in ("id", "name", "status", "image", "service", "ports")}
+            for c in cache.list(all=all)
+        ]
         return {"containers": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -186,69 +1279,231 @@ async def list_containers(all: bool = False):
 async def get_container(container_name: str):
     """Get details for a specific container"""
     try:
-        container = client.containers.get(container_name)
-        return {
-            "id": container.short_id,
-            "name": container.name,
-            "status": container.status,
-            "image": container.image.tags[0] if container.image.tags else container.image.short_id,
-            "ports": container.ports,
-            "created": container.attrs["Created"],
-            "state": container.attrs["State"],
-        }
-    except docker.errors.NotFound:
-        raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
+        cache = await cached_containers()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    container = cache.get(container_name)
+    if container is None:
+        raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
+    return {key: container[key] for key in ("id", "name", "status", "image", "ports", "created", "state")}
+
+
+def perform_container_action(container_name: str, action: str):
+    """Run a container action on a worker thread and refresh its cached state"""
+    container = client.containers.get(container_name)
+    if action == "start":
+        container.start()
+    elif action == "stop":
+        container.stop(timeout=10)
+    elif action == "restart":
+        container.restart(timeout=10)
+    container_cache.refresh(container.id)
 
 
 @app.post("/api/containers/{container_name}/action")
 async def container_action(container_name: str, action: ContainerAction):
     """Perform action on container: start, stop, restart"""
-    try:
-        container = client.containers.get(container_name)
-
-        if action.action == "start":
-            container.start()
-            return {"message": f"Container '{container_name}' started", "status": "started"}
-        elif action.action == "stop":
-            container.stop(timeout=10)
-            return {"message": f"Container '{container_name}' stopped", "status": "stopped"}
-        elif action.action == "restart":
-            container.restart(timeout=10)
-            return {"message": f"Container '{container_name}' restarted", "status": "restarted"}
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown action: {action.action}")
+    messages = {"start": "started", "stop": "stopped", "restart": "restarted"}
+    if action.action not in messages:
+        raise HTTPException(status_code=400, detail=f"Unknown action: {action.action}")
 
+    try:
+        await asyncio.to_thread(perform_container_action, container_name, action.action)
+        status = messages[action.action]
+        return {"message": f"Container '{container_name}' {status}", "status": status}
     except docker.errors.NotFound:
         raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def read_container_logs(container_name: str, lines: int) -> str:
+    container = client.containers.get(container_name)
+    return container.logs(tail=lines, timestamps=True).decode("utf-8")
+
+
 @app.get("/api/containers/{container_name}/logs")
 async def get_container_logs(container_name: str, lines: int = 100):
     """Get container logs"""
     try:
-        container = client.containers.get(container_name)
-        logs = container.logs(tail=lines, timestamps=True).decode("utf-8")
+        logs = await asyncio.to_thread(read_container_logs, container_name, lines)
         return {"container": container_name, "logs": logs}
     except docker.errors.NotFound:
         raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+LOG_STREAM_BATCH_LINES = 500  # Most lines in one SSE frame
+LOG_STREAM_BATCH_WAIT = 0.1  # Seconds to gather more lines into a frame
+LOG_STREAM_BUFFER = 2000  # Lines waiting for the client before the Docker read pauses
+LOG_STREAM_KEEPALIVE = 15  # Seconds of silence before a keepalive comment
+
+
+def parse_log_time(value: Optional[str], name: str):
+    """Unix seconds or an ISO 8601 timestamp, as accepted by the Docker SDK"""
+    if value is None:
+        return None
+    from datetime import datetime
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: use unix seconds or ISO 8601")
+
+
+class ContainerLogStream:
+    """Reads one container's log in a thread and hands filtered lines to the event loop.
+
+    The reader takes a credit per line and the consumer returns it, so at most
+    LOG_STREAM_BUFFER lines wait in memory; past that, the Docker read itself
+    pauses until the client catches up.
+    """
+
+    _END = object()
+
+    def __init__(self, container, pattern: Optional[re.Pattern], **log_options):
+        self.container = container
+        self.pattern = pattern
+        self.log_options = log_options
+        self.queue = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+        self._credits = threading.Semaphore(LOG_STREAM_BUFFER)
+        self._stream = None
+        self._closed = False
+
+    def _put(self, item):
+        self._credits.acquire()
+        if not self._closed:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def _read(self):
+        partial = ""
+        try:
+            self._stream = self.container.logs(stream=True, timestamps=True, **self.log_options)
+            for chunk in self._stream:
+                if self._closed:
+                    break
+                *lines, partial = (partial + chunk.decode("utf-8", errors="replace")).split("\n")
+                for line in lines:
+                    if self.pattern is None or self.pattern.search(line):
+                        self._put(line)
+            if partial and (self.pattern is None or self.pattern.search(partial)):
+                self._put(partial)
+        except Exception as e:
+            if not self._closed:
+                self._put(e)
+        self._put(self._END)
+
+    def start(self):
+        threading.Thread(target=self._read, name=f"logs-{self.container.name}", daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        self._credits.release(LOG_STREAM_BUFFER)  # Unblock a reader waiting for credit
+        stream = self._stream
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()  # Unblock a reader waiting on the socket
+            except Exception:
+                pass
+
+    async def _get(self, timeout: Optional[float]):
+        item = await asyncio.wait_for(self.queue.get(), timeout)
+        self._credits.release()
+        return item
+
+    async def batches(self):
+        """Yield lists of lines (None on an idle keepalive) until the log ends"""
+        while True:
+            try:
+                item = await self._get(LOG_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            batch = []
+            deadline = self.loop.time() + LOG_STREAM_BATCH_WAIT
+            while True:
+                if item is self._END:
+                    if batch:
+                        yield batch
+                    return
+                if isinstance(item, Exception):
+                    if batch:
+                        yield batch
+                    raise item
+                batch.append(item)
+                if len(batch) >= LOG_STREAM_BATCH_LINES:
+                    break
+                try:
+                    item = await self._get(max(deadline - self.loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+            yield batch
+
+
+@app.get("/api/containers/{container_name}/logs/stream")
+async def stream_container_logs(container_name: str, tail: int = 100, since: Optional[str] = None,
+                                until: Optional[str] = None, follow: bool = True,
+                                grep: Optional[str] = None, ignore_case: bool = False):
+    """Stream container logs as Server-Sent Events.
+
+    Starts with the last `tail` lines (-1 for all, bounded by `since`), then
+    follows new output unless follow=false or `until` is reached. `grep` is
+    a regex applied on the server. Each frame is {"type": "logs", "lines": [...]};
+    the stream closes with {"type": "end"} or {"type": "error", "error": ...}.
+    """
+    try:
+        pattern = re.compile(grep, re.IGNORECASE if ignore_case else 0) if grep else None
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid grep pattern: {e}")
+    log_options = {"follow": follow, "tail": tail if tail >= 0 else "all"}
+    since_time, until_time = parse_log_time(since, "since"), parse_log_time(until, "until")
+    if since_time is not None:
+        log_options["since"] = since_time
+    if until_time is not None:
+        log_options["until"] = until_time
+    try:
+        container = await asyncio.to_thread(client.containers.get, container_name)
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
+
+    async def generate():
+        logs = ContainerLogStream(container, pattern, **log_options)
+        logs.start()
+        try:
+            async with aclosing(logs.batches()) as batches:
+                async for batch in batches:
+                    if batch is None:
+                        yield b": keepalive\n\n"
+                    else:
+                        yield sse_frame(json_bytes({"type": "logs", "lines": batch}))
+            yield sse_frame(json_bytes({"type": "end"}))
+        except Exception as e:
+            yield sse_frame(json_bytes({"type": "error", "error": str(e)}))
+        finally:
+            logs.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 
 # ============ Services (Managed Containers + Ollama) ============
 
-def check_ollama_status():
+async def check_ollama_status():
     """Check if Ollama is running via process check"""
     try:
         # Check if ollama process is running (snap or direct install)
-        result = subprocess.run(
-            ["pgrep", "-f", "ollama.*serve"],
-            capture_output=True, timeout=5
-        )
+        result = await run_command(["pgrep", "-f", "ollama.*serve"], timeout=5)
         if result.returncode == 0 and result.stdout.strip():
             return "running"
         return "stopped"
@@ -258,23 +1513,24 @@ def check_ollama_status():
 @app.get("/api/services")
 async def list_services():
     """List all managed services with their status"""
+    return {"services": await managed_services()}
+
+
+async def managed_services() -> list:
+    """Managed containers from the container cache plus the sampled Ollama status"""
     services = []
+    try:
+        await cached_containers()
+    except Exception:
+        pass
 
     # Add Docker container services
     for name, info in MANAGED_SERVICES.items():
-        try:
-            container = client.containers.get(info["container"])
-            status = container.status
-        except docker.errors.NotFound:
-            status = "not found"
-        except Exception:
-            status = "error"
-
         services.append({
             "name": name,
             "container": info["container"],
             "description": info["description"],
-            "status": status,
+            "status": container_status(info["container"]),
         })
 
     # Add Ollama (process-based service)
@@ -282,10 +1538,10 @@ async def list_services():
         "name": "ollama",
         "container": None,
         "description": "LLM inference engine",
-        "status": check_ollama_status(),
+        "status": (await sampler.get("ollama")).get("data", "unknown"),
     })
 
-    return {"services": services}
+    return services
 
 
 @app.post("/api/services/{service_name}/restart")
@@ -297,9 +1553,9 @@ async def restart_service(service_name: str):
     if service_name == "ollama":
         try:
             # Kill Ollama processes - snap will auto-restart if enabled
-            subprocess.run(["pkill", "-f", "ollama.*serve"], timeout=10, check=False)
+            await run_command(["pkill", "-f", "ollama.*serve"], timeout=10)
             await asyncio.sleep(3)  # Wait for snap auto-restart
-            status = check_ollama_status()
+            status = await check_ollama_status()
             if status == "running":
                 return {"message": "Ollama restarted (snap auto-restart)", "status": status}
             else:
@@ -313,8 +1569,7 @@ async def restart_service(service_name: str):
 
     container_name = MANAGED_SERVICES[service_name]["container"]
     try:
-        container = client.containers.get(container_name)
-        container.restart(timeout=10)
+        await asyncio.to_thread(perform_container_action, container_name, "restart")
         return {"message": f"Service '{service_name}' restarted", "container": container_name}
     except docker.errors.NotFound:
         raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
@@ -343,9 +1598,9 @@ async def stop_service(service_name: str):
     if service_name == "ollama":
         try:
             # Kill Ollama processes
-            subprocess.run(["pkill", "-f", "ollama.*serve"], timeout=10, check=False)
+            await run_command(["pkill", "-f", "ollama.*serve"], timeout=10)
             await asyncio.sleep(1)
-            status = check_ollama_status()
+            status = await check_ollama_status()
             return {"message": "Ollama stopped", "status": status}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to stop Ollama: {str(e)}")
@@ -356,6 +1611,13 @@ async def stop_service(service_name: str):
 
 # ============ GPU & System Stats ============
 
+# Telemetry is collected by a single background sampler instead of per request,
+# so the work per sample is the same however many dashboards are polling.
+TELEMETRY_INTERVAL = float(os.environ.get("TELEMETRY_INTERVAL", "5"))
+TELEMETRY_HISTORY_SIZE = int(os.environ.get("TELEMETRY_HISTORY_SIZE", "720"))  # 1 hour at 5s
+TELEMETRY_PROCESS_LIMIT = 25  # Processes kept per sample; /api/processes slices from these
+
+
 def parse_nvidia_value(val, type_fn=int, default=0):
     """Parse nvidia-smi value, handling N/A and [N/A]"""
     val = val.strip().replace("[", "").replace("]", "")
@@ -367,100 +1629,118 @@ def parse_nvidia_value(val, type_fn=int, default=0):
         return default
 
 
-@app.get("/api/gpu")
-async def get_gpu_stats():
-    """Get GPU stats via nvidia-smi"""
-    try:
-        result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=name,memory.used,memory.total,utilization.gpu,temperature.gpu,power.draw",
-             "--format=csv,noheader,nounits"],
-            capture_output=True, text=True, timeout=10
-        )
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail="nvidia-smi failed")
+class GpuCollector:
+    """Source of GPU stats for the telemetry sampler.
 
-        parts = result.stdout.strip().split(", ")
-        if len(parts) >= 6:
-            return {
-                "name": parts[0].strip(),
-                "memory_used_mb": parse_nvidia_value(parts[1], int, 0),
-                "memory_total_mb": parse_nvidia_value(parts[2], int, 128000),
-                "utilization_percent": parse_nvidia_value(parts[3], int, 0),
-                "temperature_c": parse_nvidia_value(parts[4], int, 0),
-                "power_draw_w": parse_nvidia_value(parts[5], float, 0.0),
-            }
-        return {"raw": result.stdout}
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="nvidia-smi timed out")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="nvidia-smi not found")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    gpus() returns one dict per GPU in the /api/gpu shape; processes() returns
+    per-process GPU memory as {"pid", "gpu_memory_mb", "name"} dicts.
+    """
 
+    name = "base"
 
-@app.get("/api/disk")
-async def get_disk_stats():
-    """Get disk usage stats"""
-    try:
-        result = subprocess.run(
-            ["df", "-h", "/"],
-            capture_output=True, text=True, timeout=10
-        )
-        lines = result.stdout.strip().split("\n")
-        if len(lines) >= 2:
-            parts = lines[1].split()
-            return {
-                "filesystem": parts[0],
-                "size": parts[1],
-                "used": parts[2],
-                "available": parts[3],
-                "use_percent": parts[4],
-            }
-        return {"raw": result.stdout}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    def gpus(self) -> list:
+        raise NotImplementedError
 
+    def processes(self) -> list:
+        raise NotImplementedError
 
-@app.get("/api/processes")
-async def get_top_processes(limit: int = 10):
-    """Get top processes by CPU and memory usage, plus GPU processes"""
-    try:
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'memory_info', 'cmdline']):
-            try:
-                info = proc.info
-                # Skip kernel processes and very low usage
-                if info['cpu_percent'] is None or info['memory_percent'] is None:
-                    continue
-                # Build a useful cmdline summary
-                cmdline = info['cmdline']
-                if cmdline:
-                    # Join full cmdline but truncate to reasonable length
-                    full_cmd = ' '.join(cmdline)
-                    # Truncate at 120 chars for display
-                    cmdline_display = full_cmd[:120] + ('...' if len(full_cmd) > 120 else '')
-                else:
-                    cmdline_display = info['name']
+    def close(self):
+        pass
+
+
+class NvmlGpuCollector(GpuCollector):
+    """GPU stats via NVML, holding one library handle for the process lifetime"""
 
+    name = "nvml"
+
+    def __init__(self):
+        import pynvml
+        self.nvml = pynvml
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+
+    def _value(self, fn, default):
+        # Unified-memory and some embedded GPUs report NotSupported for some fields,
+        # the same cases nvidia-smi prints as [N/A]
+        try:
+            return fn()
+        except self.nvml.NVMLError:
+            return default
+
+    def gpus(self) -> list:
+        nvml = self.nvml
+        gpus = []
+        for index, handle in enumerate(self.handles):
+            name = self._value(lambda: nvml.nvmlDeviceGetName(handle), "unknown")
+            memory = self._value(lambda: nvml.nvmlDeviceGetMemoryInfo(handle), None)
+            gpus.append({
+                "index": index,
+                "name": name.decode() if isinstance(name, bytes) else name,
+                "memory_used_mb": memory.used // (1024 * 1024) if memory else 0,
+                "memory_total_mb": memory.total // (1024 * 1024) if memory else 128000,
+                "utilization_percent": self._value(lambda: nvml.nvmlDeviceGetUtilizationRates(handle).gpu, 0),
+                "temperature_c": self._value(lambda: nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU), 0),
+                "power_draw_w": round(self._value(lambda: nvml.nvmlDeviceGetPowerUsage(handle), 0) / 1000, 2),
+            })
+        return gpus
+
+    def processes(self) -> list:
+        processes = []
+        for handle in self.handles:
+            for proc in self._value(lambda: self.nvml.nvmlDeviceGetComputeRunningProcesses(handle), []):
+                try:
+                    name = psutil.Process(proc.pid).name()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    name = str(proc.pid)
                 processes.append({
-                    'pid': info['pid'],
-                    'name': info['name'],
-                    'cpu_percent': round(info['cpu_percent'], 1),
-                    'memory_percent': round(info['memory_percent'], 1),
-                    'memory_mb': round(info['memory_info'].rss / (1024 * 1024), 1) if info['memory_info'] else 0,
-                    'cmdline': cmdline_display
+                    'pid': proc.pid,
+                    'gpu_memory_mb': (proc.usedGpuMemory or 0) // (1024 * 1024),
+                    'name': name
                 })
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
+        return processes
+
+    def close(self):
+        self.nvml.nvmlShutdown()
+
+
+class NvidiaSmiGpuCollector(GpuCollector):
+    """GPU stats by forking nvidia-smi, used when NVML is unavailable"""
 
-        # Sort by CPU, then memory
-        top_cpu = sorted(processes, key=lambda x: x['cpu_percent'], reverse=True)[:limit]
-        top_memory = sorted(processes, key=lambda x: x['memory_percent'], reverse=True)[:limit]
+    name = "nvidia-smi"
 
-        # Get GPU processes via nvidia-smi
-        gpu_processes = []
+    def gpus(self) -> list:
+        try:
+            result = run_process_sync(
+                ["nvidia-smi", "--query-gpu=index,name,memory.used,memory.total,utilization.gpu,temperature.gpu,power.draw",
+                 "--format=csv,noheader,nounits"],
+                capture_output=True, text=True, timeout=10
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("nvidia-smi timed out")
+        except FileNotFoundError:
+            raise RuntimeError("nvidia-smi not found")
+        if result.returncode != 0:
+            raise RuntimeError("nvidia-smi failed")
+
+        gpus = []
+        for line in result.stdout.strip().split("\n"):
+            parts = line.split(", ")
+            if len(parts) >= 7:
+                gpus.append({
+                    "index": parse_nvidia_value(parts[0], int, len(gpus)),
+                    "name": parts[1].strip(),
+                    "memory_used_mb": parse_nvidia_value(parts[2], int, 0),
+                    "memory_total_mb": parse_nvidia_value(parts[3], int, 128000),
+                    "utilization_percent": parse_nvidia_value(parts[4], int, 0),
+                    "temperature_c": parse_nvidia_value(parts[5], int, 0),
+                    "power_draw_w": parse_nvidia_value(parts[6], float, 0.0),
+                })
+        return gpus
+
+    def processes(self) -> list:
+        processes = []
         try:
-            result = subprocess.run(
+            result = run_process_sync(
                 ["nvidia-smi", "--query-compute-apps=pid,used_memory,process_name", "--format=csv,noheader,nounits"],
                 capture_output=True, text=True, timeout=5
             )
@@ -468,176 +1748,1406 @@ async def get_top_processes(limit: int = 10):
                 for line in result.stdout.strip().split('\n'):
                     parts = [p.strip() for p in line.split(',')]
                     if len(parts) >= 3:
-                        gpu_processes.append({
+                        processes.append({
                             'pid': int(parts[0]),
-                            'gpu_memory_mb': int(parts[1]),
+                            'gpu_memory_mb': parse_nvidia_value(parts[1], int, 0),
                             'name': parts[2].split('/')[-1]  # Get just the process name
                         })
         except (subprocess.TimeoutExpired, FileNotFoundError):
             pass
+        return processes
 
+
+class FakeGpuCollector(GpuCollector):
+    """Static GPU data for tests and machines without a GPU"""
+
+    name = "fake"
+
+    def __init__(self, gpus: Optional[list] = None, processes: Optional[list] = None):
+        self._gpus = gpus if gpus is not None else [{
+            "index": 0,
+            "name": "Fake GPU",
+            "memory_used_mb": 1024,
+            "memory_total_mb": 128000,
+            "utilization_percent": 0,
+            "temperature_c": 40,
+            "power_draw_w": 10.0,
+        }]
+        self._processes = processes or []
+
+    def gpus(self) -> list:
+        return [dict(gpu) for gpu in self._gpus]
+
+    def processes(self) -> list:
+        return [dict(proc) for proc in self._processes]
+
+
+def create_gpu_collector(kind: str = "auto") -> GpuCollector:
+    """Build the GPU collector named by `kind`: auto, nvml, nvidia-smi or fake.
+
+    auto prefers NVML and falls back to nvidia-smi when pynvml or the driver
+    library is missing.
+    """
+    if kind == "fake":
+        return FakeGpuCollector()
+    if kind == "nvidia-smi":
+        return NvidiaSmiGpuCollector()
+    try:
+        return NvmlGpuCollector()
+    except Exception:
+        if kind == "nvml":
+            raise
+        return NvidiaSmiGpuCollector()
+
+
+gpu_collector = create_gpu_collector(os.environ.get("GPU_COLLECTOR", "auto"))
+
+
+def collect_gpu_stats() -> dict:
+    """Collect GPU stats; the first GPU's fields stay top-level for existing clients"""
+    gpus = gpu_collector.gpus()
+    if not gpus:
+        raise RuntimeError("No GPUs found")
+    first = {k: v for k, v in gpus[0].items() if k != "index"}
+    return {**first, "gpus": gpus}
+
+
+def collect_disk_stats() -> dict:
+    """Collect disk usage stats for the root filesystem"""
+    result = run_process_sync(
+        ["df", "-h", "/"],
+        capture_output=True, text=True, timeout=10
+    )
+    lines = result.stdout.strip().split("\n")
+    if len(lines) >= 2:
+        parts = lines[1].split()
         return {
-            'top_cpu': top_cpu,
-            'top_memory': top_memory,
-            'gpu_processes': gpu_processes
+            "filesystem": parts[0],
+            "size": parts[1],
+            "used": parts[2],
+            "available": parts[3],
+            "use_percent": parts[4],
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {"raw": result.stdout}
+
+
+PROCESS_SORT_KEYS = {
+    "cpu": "cpu_percent",
+    "memory": "memory_percent",
+    "gpu": "gpu_memory_mb",
+}
+
+
+def format_cmdline(cmdline: list, name: str) -> str:
+    """Build a useful cmdline summary, truncated to 120 chars for display"""
+    if not cmdline:
+        return name
+    full_cmd = ' '.join(cmdline)
+    return full_cmd[:120] + ('...' if len(full_cmd) > 120 else '')
+
+
+class ProcessTracker:
+    """Long-lived process table keyed by (pid, create_time).
+
+    psutil.Process objects are kept across samples so cpu_percent() measures
+    the delta since the previous sample instead of returning 0.0 for a fresh
+    object. Name and cmdline are read once when a process is first seen.
+    """
+
+    def __init__(self):
+        self.entries = {}  # pid -> {"create_time", "process", "name", "cmdline"}
+        self.rows = []  # Latest table, replaced wholesale on each update
+
+    def _entry(self, pid: int) -> Optional[dict]:
+        entry = self.entries.get(pid)
+        if entry is not None:
+            # is_running() compares the cached create time, so a reused pid is not mistaken for it
+            if entry["process"].is_running():
+                return entry
+            # pid was reused by a new process (or it exited, and Process() below raises NoSuchProcess)
+        process = psutil.Process(pid)
+        with process.oneshot():
+            name = process.name()
+            try:
+                cmdline = process.cmdline()
+            except (psutil.AccessDenied, psutil.ZombieProcess):
+                cmdline = []
+            entry = {
+                "create_time": process.create_time(),
+                "process": process,
+                "name": name,
+                "cmdline": format_cmdline(cmdline, name),
+            }
+        process.cpu_percent(None)  # Prime the CPU counter; the first reading is always 0.0
+        self.entries[pid] = entry
+        return entry
+
+    def update(self, gpu_processes: list) -> list:
+        """Refresh the table from /proc and join per-process GPU memory"""
+        gpu_memory = {}
+        for proc in gpu_processes:
+            gpu_memory[proc['pid']] = gpu_memory.get(proc['pid'], 0) + proc['gpu_memory_mb']
+
+        total_memory = psutil.virtual_memory().total
+        rows = []
+        live = set()
+        for pid in psutil.pids():
+            try:
+                entry = self._entry(pid)
+                if entry is None:
+                    continue
+                process = entry["process"]
+                with process.oneshot():
+                    cpu = process.cpu_percent(None)
+                    rss = process.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            live.add(pid)
+            rows.append({
+                'pid': pid,
+                'name': entry["name"],
+                'cpu_percent': round(cpu, 1),
+                'memory_percent': round(rss / total_memory * 100, 1),
+                'memory_mb': round(rss / (1024 * 1024), 1),
+                'gpu_memory_mb': gpu_memory.get(pid, 0),
+                'cmdline': entry["cmdline"]
+            })
+
+        for pid in self.entries.keys() - live:
+            del self.entries[pid]
+        self.rows = rows
+        return rows
+
+    def query(self, sort: str = "cpu", limit: int = 10, filter: Optional[str] = None) -> list:
+        """Top `limit` rows of the cached table by `sort`, optionally name/cmdline filtered"""
+        rows = self.rows
+        if filter:
+            needle = filter.lower()
+            rows = [r for r in rows if needle in r['name'].lower() or needle in r['cmdline'].lower()]
+        key = PROCESS_SORT_KEYS[sort]
+        return heapq.nlargest(limit, rows, key=lambda r: r[key])
+
+
+process_tracker = ProcessTracker()
+
+
+def collect_top_processes(limit: int = TELEMETRY_PROCESS_LIMIT) -> dict:
+    """Collect top processes by CPU and memory usage, plus GPU processes"""
+    gpu_processes = gpu_collector.processes()
+    start = time.perf_counter()
+    process_tracker.update(gpu_processes)
+    PROCESS_SCAN_SECONDS.observe(time.perf_counter() - start)
+    return {
+        'top_cpu': process_tracker.query("cpu", limit),
+        'top_memory': process_tracker.query("memory", limit),
+        'gpu_processes': gpu_processes
+    }
+
+
+class TelemetrySampler:
+    """Samples telemetry collectors on a fixed interval into ring buffers.
+
+    Each collector is a blocking function run in a worker thread, or a coroutine
+    function awaited on the loop. Every sample is stored as {"timestamp", "data"}
+    or {"timestamp", "error"} so a failing collector (e.g. no GPU) doesn't stop
+    the others.
+    """
+
+    def __init__(self, collectors: dict, interval: float, history_size: int):
+        self.collectors = collectors
+        self.interval = interval
+        self.latest = {}
+        self.history = {name: deque(maxlen=history_size) for name in collectors}
+        self.last_sample_at = 0.0
+        self.listeners = set()  # asyncio.Events set after every sample
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    async def _collect(name: str, fn, timestamp: float) -> dict:
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                data = await fn()
+            else:
+                data = await asyncio.to_thread(fn)
+            return {"timestamp": timestamp, "data": data}
+        except Exception as e:
+            return {"timestamp": timestamp, "error": str(e)}
+        finally:
+            TELEMETRY_COLLECTOR_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+    async def sample(self):
+        """Run every collector once and record the results"""
+        timestamp = time.time()
+        names = list(self.collectors)
+        entries = await asyncio.gather(
+            *(self._collect(name, self.collectors[name], timestamp) for name in names)
+        )
+        for name, entry in zip(names, entries):
+            self.latest[name] = entry
+            self.history[name].append(entry)
+        self.last_sample_at = timestamp
+        for listener in self.listeners:
+            listener.set()
+
+    async def _run(self):
+        while True:
+            async with self._lock:
+                await self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get(self, name: str) -> dict:
+        """Latest sample for a collector, sampling once if nothing is buffered yet"""
+        if name not in self.latest:
+            async with self._lock:
+                if name not in self.latest:
+                    await self.sample()
+        return self.latest[name]
+
+    def since(self, name: str, since: float = 0) -> list:
+        """Buffered samples for a collector newer than `since` (unix seconds)"""
+        return [entry for entry in self.history[name] if entry["timestamp"] > since]
+
+
+sampler = TelemetrySampler(
+    {
+        "gpu": collect_gpu_stats,
+        "disk": collect_disk_stats,
+        "processes": collect_top_processes,
+        "ollama": check_ollama_status,
+    },
+    interval=TELEMETRY_INTERVAL,
+    history_size=TELEMETRY_HISTORY_SIZE,
+)
+
+
+@app.on_event("startup")
+async def start_telemetry_sampler():
+    sampler.start()
+
+
+@app.on_event("shutdown")
+async def stop_telemetry_sampler():
+    await sampler.stop()
+    gpu_collector.close()
+
+
+async def latest_telemetry(name: str):
+    """Latest sampled data for a collector, or a 500 if the last sample failed"""
+    entry = await sampler.get(name)
+    if "error" in entry:
+        raise HTTPException(status_code=500, detail=entry["error"])
+    return entry["data"]
+
+
+@app.get("/api/gpu")
+async def get_gpu_stats(request: Request):
+    """Get latest sampled GPU stats"""
+    return encoded_response(request, await latest_telemetry("gpu"))
+
+
+@app.get("/api/disk")
+async def get_disk_stats(request: Request):
+    """Get latest sampled disk usage stats"""
+    return encoded_response(request, await latest_telemetry("disk"))
+
+
+@app.get("/api/processes")
+async def get_top_processes(request: Request, limit: int = 10, sort: Optional[str] = None,
+                            filter: Optional[str] = None):
+    """Get top processes by CPU and memory usage, plus GPU processes.
+
+    Without `sort`/`filter` this returns the sampled top lists. With them, it
+    queries the sampler's cached process table: `filter` matches name or
+    cmdline, and `sort` (cpu, memory, gpu) adds a `processes` list.
+    """
+    data = await latest_telemetry("processes")
+    if sort is None and not filter:
+        return encoded_response(request, {
+            'top_cpu': data['top_cpu'][:limit],
+            'top_memory': data['top_memory'][:limit],
+            'gpu_processes': data['gpu_processes']
+        })
+
+    if sort is not None and sort not in PROCESS_SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown sort: {sort}. Valid sorts: {list(PROCESS_SORT_KEYS)}"
+        )
+    result = {
+        'top_cpu': process_tracker.query("cpu", limit, filter),
+        'top_memory': process_tracker.query("memory", limit, filter),
+        'gpu_processes': data['gpu_processes']
+    }
+    if sort is not None:
+        result['processes'] = process_tracker.query(sort, limit, filter)
+    return encoded_response(request, result)
+
+
+@app.get("/api/telemetry/history")
+async def get_telemetry_history(request: Request, since: float = 0, metrics: str = "gpu,disk"):
+    """Get buffered telemetry samples newer than `since` (unix seconds).
+
+    `metrics` is a comma-separated list of collectors (gpu, disk, processes, ollama).
+    """
+    names = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in names if m not in sampler.collectors]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metrics: {unknown}. Valid metrics: {list(sampler.collectors)}"
+        )
+    return encoded_response(request, {
+        "interval": sampler.interval,
+        "series": {name: sampler.since(name, since) for name in names},
+    })
+
+
+# ============ Snapshot ============
+
+SNAPSHOT_FIELDS = ["gpu", "disk", "processes", "services", "containers", "ollama"]
+
+
+async def build_snapshot(fields: list, process_limit: int) -> dict:
+    """One document of the requested fields, built only from cached collectors"""
+    snapshot = {}
+    timestamps = []
+
+    for name in ("gpu", "disk", "processes", "ollama"):
+        if name in fields:
+            entry = await sampler.get(name)
+            timestamps.append(entry["timestamp"])
+            snapshot[name] = entry["data"] if "error" not in entry else {"error": entry["error"]}
+
+    if "processes" in snapshot and "error" not in snapshot["processes"]:
+        processes = snapshot["processes"]
+        snapshot["processes"] = {
+            'top_cpu': processes['top_cpu'][:process_limit],
+            'top_memory': processes['top_memory'][:process_limit],
+            'gpu_processes': processes['gpu_processes']
+        }
+
+    if "services" in fields or "containers" in fields:
+        try:
+            cache = await cached_containers()
+            timestamps.append(cache.updated_at)
+            if "containers" in fields:
+                snapshot["containers"] = [
+                    {key: c[key] for key in ("id", "name", "status", "image", "service", "ports")}
+                    for c in cache.list(all=True)
+                ]
+        except Exception as e:
+            if "containers" in fields:
+                snapshot["containers"] = {"error": str(e)}
+        if "services" in fields:
+            snapshot["services"] = await managed_services()
+
+    # The snapshot is as fresh as its newest input, so an unchanged document keeps its ETag
+    snapshot["timestamp"] = max(timestamps) if timestamps else time.time()
+    return snapshot
+
+
+@app.get("/api/snapshot")
+async def get_snapshot(request: Request, fields: str = ",".join(SNAPSHOT_FIELDS), process_limit: int = 10):
+    """Get everything the dashboards poll in one timestamped document.
+
+    `fields` is a comma-separated selector over gpu, disk, processes, services,
+    containers and ollama. Responses carry an ETag; a matching If-None-Match
+    returns 304 with no body. Send `Accept: application/msgpack` for msgpack.
+    """
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in SNAPSHOT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {unknown}. Valid fields: {SNAPSHOT_FIELDS}"
+        )
+
+    snapshot = await build_snapshot(selected, process_limit)
+    if wants_msgpack(request):
+        body, media_type = msgpack_bytes(snapshot), "application/msgpack"
+    else:
+        body, media_type = json_bytes(snapshot, sort_keys=True), "application/json"
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+# ============ Telemetry Streaming ============
+
+# Seconds a WebSocket subscriber may take to accept one frame before it is dropped
+TELEMETRY_SEND_TIMEOUT = 10
+
+
+class TelemetryStream:
+    """Pushes sampler output to SSE and WebSocket subscribers.
+
+    Each subscriber waits on an asyncio.Event the sampler sets after every
+    sample. Samples that arrive while a subscriber is still sending or inside
+    its minimum interval coalesce into the next frame, so a slow consumer never
+    builds a queue. Encoded frames are cached per field selection, so one sample
+    is serialized once however many clients watch it.
+    """
+
+    def __init__(self):
+        self._frames = {}  # (fields, process_limit, binary) -> (version, frame)
+
+    async def frame(self, fields: tuple, process_limit: int, binary: bool = False) -> bytes:
+        version = (sampler.last_sample_at, container_cache.updated_at)
+        key = (fields, process_limit, binary)
+        cached = self._frames.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        snapshot = await build_snapshot(list(fields), process_limit)
+        frame = msgpack_bytes(snapshot) if binary else json_bytes(snapshot)
+        self._frames[key] = (version, frame)
+        return frame
+
+    async def frames(self, fields: tuple, interval: float, process_limit: int, binary: bool = False):
+        """Yield encoded frames (JSON, or msgpack if `binary`), at most one per `interval` seconds"""
+        wake = asyncio.Event()
+        wake.set()  # Send the latest sample straight away
+        sampler.listeners.add(wake)
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                yield await self.frame(fields, process_limit, binary)
+                await asyncio.sleep(interval)
+        finally:
+            sampler.listeners.discard(wake)
+
+
+telemetry_stream = TelemetryStream()
+
+
+def parse_stream_fields(fields: str) -> tuple:
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in SNAPSHOT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {unknown}. Valid fields: {SNAPSHOT_FIELDS}"
+        )
+    return selected
+
+
+async def pump_websocket(websocket: WebSocket, frames, binary: bool = False):
+    """Send encoded frames from an async generator to an accepted WebSocket until either side ends.
+
+    Frames go out as text messages, or as binary messages when `binary`.
+    """
+
+    async def send_frames():
+        async with aclosing(frames):
+            async for frame in frames:
+                message = {"type": "websocket.send", "bytes": frame} if binary else \
+                    {"type": "websocket.send", "text": frame.decode()}
+                # A client that can't take a frame in time is dropped rather than buffered for
+                await asyncio.wait_for(websocket.send(message), timeout=TELEMETRY_SEND_TIMEOUT)
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = {asyncio.create_task(send_frames()), asyncio.create_task(wait_for_disconnect())}
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+
+@app.get("/api/telemetry/stream")
+async def telemetry_stream_sse(fields: str = "gpu,disk,processes", interval: float = TELEMETRY_INTERVAL,
+                               process_limit: int = 10):
+    """Stream telemetry snapshots as Server-Sent Events.
+
+    `fields` selects from the /api/snapshot fields; `interval` is the minimum
+    number of seconds between frames.
+    """
+    selected = parse_stream_fields(fields)
+
+    async def generate():
+        async with aclosing(telemetry_stream.frames(selected, max(interval, 0), process_limit)) as frames:
+            async for frame in frames:
+                yield sse_frame(frame)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.websocket("/api/telemetry/ws")
+async def telemetry_stream_ws(websocket: WebSocket, fields: str = "gpu,disk,processes",
+                              interval: float = TELEMETRY_INTERVAL, process_limit: int = 10, format: str = "json"):
+    """Stream telemetry snapshots over a WebSocket; same parameters as /api/telemetry/stream.
+
+    `format=msgpack` sends each snapshot as a binary msgpack message instead of JSON text.
+    """
+    try:
+        selected = parse_stream_fields(fields)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    if format not in ("json", "msgpack") or (format == "msgpack" and msgpack is None):
+        await websocket.close(code=1008, reason=f"Unsupported format: {format}")
+        return
+
+    binary = format == "msgpack"
+    await websocket.accept()
+    await pump_websocket(websocket, telemetry_stream.frames(selected, max(interval, 0), process_limit, binary),
+                         binary=binary)
+
+
+# ============ Container Stats ============
+
+CONTAINER_STATS_RECONCILE = 5  # Seconds between checks for managed containers starting or stopping
+
+
+def cgroup_memory_cache(memory_stats: dict) -> int:
+    """Page cache counted in usage (cgroup v2, then v1 names), as `docker stats` subtracts it"""
+    stats = memory_stats.get("stats") or {}
+    for key in ("inactive_file", "total_inactive_file", "cache"):
+        if key in stats:
+            return stats[key]
+    return 0
+
+
+def compute_container_stats(sample: dict, previous: Optional[dict], elapsed: float) -> dict:
+    """CPU%, memory, network and block I/O from one Docker stats sample.
+
+    CPU% uses the sample's own precpu_stats, like `docker stats`; network and
+    block I/O rates are deltas against the previous sample's totals.
+    """
+    cpu = sample.get("cpu_stats") or {}
+    precpu = sample.get("precpu_stats") or {}
+    cpu_delta = (cpu.get("cpu_usage") or {}).get("total_usage", 0) - (precpu.get("cpu_usage") or {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100 if system_delta > 0 and cpu_delta >= 0 else 0.0
+
+    memory = sample.get("memory_stats") or {}
+    memory_used = max(memory.get("usage", 0) - cgroup_memory_cache(memory), 0)
+    memory_limit = memory.get("limit", 0)
+
+    networks = (sample.get("networks") or {}).values()
+    net_rx = sum(n.get("rx_bytes", 0) for n in networks)
+    net_tx = sum(n.get("tx_bytes", 0) for n in networks)
+    block_read = block_write = 0
+    for entry in (sample.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            block_read += entry.get("value", 0)
+        elif op == "write":
+            block_write += entry.get("value", 0)
+
+    stats = {
+        "cpu_percent": round(cpu_percent, 1),
+        "memory_used": memory_used,
+        "memory_limit": memory_limit,
+        "memory_percent": round(memory_used / memory_limit * 100, 1) if memory_limit else 0.0,
+        "net_rx": net_rx,
+        "net_tx": net_tx,
+        "block_read": block_read,
+        "block_write": block_write,
+        "pids": (sample.get("pids_stats") or {}).get("current", 0),
+    }
+    for key in ("net_rx", "net_tx", "block_read", "block_write"):
+        delta = stats[key] - previous[key] if previous else 0
+        stats[f"{key}_rate"] = round(max(delta, 0) / elapsed) if previous and elapsed > 0 else 0
+    return stats
+
+
+class ContainerStatsMonitor:
+    """Live resource stats for every running managed container.
+
+    Runs only while someone is subscribed: one thread per container reads the
+    Docker stats stream (one sample a second) and publishes to the event loop,
+    and a reconcile task starts readers as managed containers come up.
+    Subscribers wake on each new sample, like TelemetrySampler listeners.
+    """
+
+    def __init__(self, docker_client):
+        self.client = docker_client
+        self.latest = {}  # service -> stats
+        self.updated_at = 0.0
+        self.listeners = set()
+        self._readers = {}  # container name -> generation it was started in
+        self._generation = 0
+        self._task = None
+        self._loop = None
+
+    def _read(self, service: str, container_name: str, generation: int):
+        previous, previous_at = None, None
+        try:
+            for sample in self.client.api.stats(container_name, decode=True, stream=True):
+                if generation != self._generation:
+                    break
+                now = time.monotonic()
+                stats = compute_container_stats(sample, previous, now - previous_at if previous_at else 0)
+                stats["container"] = container_name
+                previous, previous_at = stats, now
+                self._loop.call_soon_threadsafe(self._publish, service, stats)
+        except Exception:
+            pass
+        finally:
+            if self._readers.get(container_name) == generation:
+                del self._readers[container_name]
+                self._loop.call_soon_threadsafe(self._publish, service, None)
+
+    def _publish(self, service: str, stats: Optional[dict]):
+        if stats is None:
+            self.latest.pop(service, None)
+        else:
+            self.latest[service] = stats
+        self.updated_at = time.time()
+        for wake in self.listeners:
+            wake.set()
+
+    async def _reconcile(self):
+        while True:
+            try:
+                cache = await cached_containers()
+                for service, info in MANAGED_SERVICES.items():
+                    name = info["container"]
+                    summary = cache.get(name)
+                    if summary and summary["status"] == "running" and name not in self._readers:
+                        self._readers[name] = self._generation
+                        threading.Thread(target=self._read, args=(service, name, self._generation),
+                                         name=f"stats-{service}", daemon=True).start()
+            except Exception:
+                # e.g. the Docker daemon is briefly unreachable; try again next round
+                logger.exception("Container stats reconcile failed")
+            await asyncio.sleep(CONTAINER_STATS_RECONCILE)
+
+    def subscribe(self, wake: asyncio.Event):
+        self.listeners.add(wake)
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._reconcile())
+
+    def unsubscribe(self, wake: asyncio.Event):
+        self.listeners.discard(wake)
+        if not self.listeners and self._task is not None:
+            # Readers notice the new generation on their next sample and exit
+            self._task.cancel()
+            self._task = None
+            self._generation += 1
+            self._readers.clear()
+            self.latest.clear()
+
+    def frame(self) -> bytes:
+        return json_bytes({"timestamp": self.updated_at, "containers": self.latest})
+
+    async def frames(self, interval: float):
+        """Yield encoded frames, at most one per `interval` seconds"""
+        wake = asyncio.Event()
+        wake.set()
+        self.subscribe(wake)
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                yield self.frame()
+                await asyncio.sleep(interval)
+        finally:
+            self.unsubscribe(wake)
+
+
+container_stats = ContainerStatsMonitor(client)
+
+
+@app.get("/api/containers/stats/stream")
+async def container_stats_sse(interval: float = 2):
+    """Stream CPU, memory, network and block I/O for managed containers as SSE.
+
+    Frames are {"timestamp": ..., "containers": {service: stats}}, at most one
+    per `interval` seconds (samples arrive about once a second).
+    """
+
+    async def generate():
+        async with aclosing(container_stats.frames(max(interval, 0))) as frames:
+            async for frame in frames:
+                yield sse_frame(frame)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.websocket("/api/containers/stats/ws")
+async def container_stats_ws(websocket: WebSocket, interval: float = 2):
+    """Container stats over a WebSocket; same frames as /api/containers/stats/stream"""
+    await websocket.accept()
+    await pump_websocket(websocket, container_stats.frames(max(interval, 0)))
+
+
+# ============ Maintenance Jobs ============
+
+JOB_LOG_DIR = os.path.expanduser("~/.dgx-web-ui-jobs")
+JOB_HISTORY_LIMIT = int(os.environ.get("JOB_HISTORY_LIMIT", "200"))  # Finished jobs kept, with their logs
+JOB_OUTPUT_TAIL = 50  # Output lines per step kept in the job record
+JOB_LINE_LIMIT = 1024 * 1024  # Longest output line read from a step
+
+
+@database.add_schema
+def create_job_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            finished_at REAL,
+            error TEXT,
+            steps TEXT NOT NULL DEFAULT '[]',
+            result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_by_created ON jobs (created_at DESC);
+    """)
+    conn.commit()
+
+
+class JobStep(BaseModel):
+    name: str
+    argv: List[str]
+    cwd: Optional[str] = None
+    timeout: float = 60
+    allow_failure: bool = False  # Carry on with the next step if this one fails
+
+
+class JobKind:
+    """A named maintenance task: steps run in order, then an optional async finish() adds a result.
+
+    Jobs sharing a `lock` never run at the same time.
+    """
+
+    def __init__(self, name: str, description: str, steps: List[JobStep], lock: Optional[str] = None,
+                 finish=None):
+        self.name = name
+        self.description = description
+        self.steps = steps
+        self.lock = lock or name
+        self.finish = finish
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "description": self.description, "steps": [step.name for step in self.steps]}
+
+
+class JobFailed(Exception):
+    pass
+
+
+class Job:
+    """One run of a JobKind. Events go to a RunEventLog that is kept on disk once the job ends."""
+
+    def __init__(self, kind: JobKind):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "running"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.steps = [
+            {"name": step.name, "status": "pending", "returncode": None, "output": deque(maxlen=JOB_OUTPUT_TAIL)}
+            for step in kind.steps
+        ]
+        self.log = RunEventLog(job_log_path(self.job_id))
+        self.task = None
+
+    def emit(self, payload: dict):
+        self.log.append(json_bytes(payload))
+
+    async def run_step(self, index: int, step: JobStep):
+        """Run one step, streaming its stdout/stderr lines as output events"""
+        state = self.steps[index]
+        state["status"] = "running"
+        self.emit({"type": "step", "index": index, "name": step.name, "status": "running"})
+        start = time.perf_counter()
+        try:
+            process = await spawn_process(
+                step.argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                cwd=step.cwd, start_new_session=True, limit=JOB_LINE_LIMIT
+            )
+        except OSError as e:
+            state["status"] = "failed"
+            state["output"].append(str(e))
+            self.emit({"type": "output", "index": index, "stream": "stderr", "line": str(e)})
+            self.emit({"type": "step", "index": index, "name": step.name, "status": "failed", "returncode": None})
+            raise JobFailed(f"{step.name} could not start: {e}")
+
+        async def pump(stream, name: str):
+            async for raw in stream:
+                line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                state["output"].append(line)
+                self.emit({"type": "output", "index": index, "stream": name, "line": line})
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"), process.wait()),
+                timeout=step.timeout
+            )
+        except asyncio.TimeoutError:
+            kill_process_group(process)
+            await process.wait()
+            state["status"] = "failed"
+            self.emit({"type": "step", "index": index, "name": step.name, "status": "failed", "returncode": None})
+            raise JobFailed(f"{step.name} timed out after {step.timeout:g}s")
+        except asyncio.CancelledError:
+            await terminate_process_group(process)
+            state["status"] = "cancelled"
+            raise
+        finally:
+            observe_subprocess(step.argv, time.perf_counter() - start)
+
+        state["returncode"] = process.returncode
+        state["status"] = "done" if process.returncode == 0 else "failed"
+        self.emit({
+            "type": "step", "index": index, "name": step.name,
+            "status": state["status"], "returncode": process.returncode,
+        })
+        if process.returncode != 0 and not step.allow_failure:
+            raise JobFailed(f"{step.name} failed with exit code {process.returncode}")
+
+    async def run(self):
+        try:
+            for index, step in enumerate(self.kind.steps):
+                await self.run_step(index, step)
+            if self.kind.finish is not None:
+                self.result = await self.kind.finish()
+            self.status = "succeeded"
+        except JobFailed as e:
+            self.status = "failed"
+            self.error = str(e)
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            self.error = "Cancelled"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        for state in self.steps:
+            if state["status"] == "pending":
+                state["status"] = "skipped"
+        self.finished_at = time.time()
+        self.emit({"type": "done", "status": self.status, "error": self.error, "result": self.result})
+        self.log.flush()
+        self.log.close()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "steps": [{**state, "output": "\n".join(state["output"])} for state in self.steps],
+            "result": self.result,
+        }
+
+
+def job_log_path(job_id: str) -> str:
+    return os.path.join(JOB_LOG_DIR, f"{job_id}.jsonl")
+
+
+def job_row_dict(row) -> dict:
+    job = dict(row)
+    job["steps"] = json.loads(job["steps"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobEngine:
+    """Runs maintenance jobs in the background and keeps their history in the shared database.
+
+    Active jobs live in memory; a finished job is read back from its row and
+    its event log file, so history and replay survive restarts.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.kinds = {}  # name -> JobKind
+        self.active = {}  # job_id -> Job
+
+    def register(self, kind: JobKind) -> JobKind:
+        self.kinds[kind.name] = kind
+        return kind
+
+    def _save(self, job: Job):
+        data = job.to_dict()
+        with self.db.lock:
+            conn = self.db.connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.job_id, job.kind.name, job.status, job.created_at, job.finished_at, job.error,
+                     json.dumps(data["steps"]), json.dumps(job.result) if job.result is not None else None)
+                )
+                expired = [row["job_id"] for row in conn.execute(
+                    "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (JOB_HISTORY_LIMIT,)
+                )]
+                conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in expired])
+        for job_id in expired:
+            try:
+                os.remove(job_log_path(job_id))
+            except FileNotFoundError:
+                pass
+
+    def recover(self):
+        """Mark jobs left running by a previous process as failed"""
+        with self.db.lock:
+            conn = self.db.connect()
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Interrupted by server restart', finished_at = ? "
+                    "WHERE status = 'running'",
+                    (time.time(),)
+                )
+
+    def start(self, kind_name: str) -> Job:
+        kind = self.kinds.get(kind_name)
+        if kind is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job kind: {kind_name}")
+        for job in self.active.values():
+            if job.kind.lock == kind.lock:
+                raise HTTPException(
+                    status_code=409, detail=f"Job {job.job_id} ({job.kind.name}) is already running"
+                )
+        job = Job(kind)
+        self.active[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def _run(self, job: Job):
+        try:
+            await asyncio.to_thread(self._save, job)
+            await job.run()
+            await asyncio.to_thread(self._save, job)
+        finally:
+            self.active.pop(job.job_id, None)
+
+    def history(self, kind: Optional[str] = None, limit: int = 50) -> list:
+        query = "SELECT * FROM jobs"
+        params = []
+        if kind:
+            query += " WHERE kind = ?"
+            params.append(kind)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self.db.lock:
+            rows = self.db.connect().execute(query, params).fetchall()
+        return [job_row_dict(row) for row in rows]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.db.lock:
+            row = self.db.connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return job_row_dict(row) if row else None
+
+    async def stop(self):
+        jobs = list(self.active.values())
+        for job in jobs:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+
+
+job_engine = JobEngine(database)
+
+
+class JobRequest(BaseModel):
+    kind: str
+
+
+@app.on_event("startup")
+async def start_job_engine():
+    os.makedirs(JOB_LOG_DIR, exist_ok=True)
+    await asyncio.to_thread(job_engine.recover)
+
+
+@app.on_event("shutdown")
+async def stop_job_engine():
+    await job_engine.stop()
+
+
+@app.get("/api/jobs")
+async def list_jobs(kind: Optional[str] = None, limit: int = 50):
+    """Job history, newest first, with running jobs' live step state"""
+    jobs = await asyncio.to_thread(job_engine.history, kind, max(1, min(limit, JOB_HISTORY_LIMIT)))
+    jobs = [job_engine.active[job["job_id"]].to_dict() if job["job_id"] in job_engine.active else job
+            for job in jobs]
+    return {"jobs": jobs, "kinds": [kind.to_dict() for kind in job_engine.kinds.values()]}
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """Start a job and return at once; follow it with /api/jobs/{id}/events"""
+    return job_engine.start(request.kind).to_dict()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_engine.active.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    record = await asyncio.to_thread(job_engine.get, job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return record
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, after: Optional[int] = None):
+    """Stream a job's step and output events.
+
+    Replays events after the SSE Last-Event-ID header (or `after`), then
+    follows the job live until it finishes.
+    """
+    job = job_engine.active.get(job_id)
+    if job is not None:
+        log = job.log
+    elif await asyncio.to_thread(job_engine.get, job_id) is not None:
+        log = await asyncio.to_thread(RunEventLog.load, job_log_path(job_id))
+    else:
+        raise HTTPException(status_code=404, detail="Job not found")
+    last_event_id = request.headers.get("last-event-id")
+    if after is None and last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    async def generate():
+        async with aclosing(log.follow(0 if after is None else after + 1)) as events:
+            async for event_id, data in events:
+                yield sse_frame(data, event_id)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"  # Disable nginx buffering
+        }
+    )
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a running job, killing its current step"""
+    job = job_engine.active.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not running")
+    job.task.cancel()
+    return {"success": True, "job_id": job_id}
 
 
 # ============ Trinity Management ============
 
 TRINITY_SERVICES = ["trinity-backend", "trinity-frontend", "trinity-mcp"]
+TRINITY_DIR = os.path.expanduser("~/trinity")
+
+
+async def trinity_version() -> Optional[str]:
+    """Latest commit of the Trinity checkout, or None if git is unavailable"""
+    try:
+        result = await run_command(["git", "-C", TRINITY_DIR, "log", "-1", "--format=%h %s (%cr)"], timeout=5)
+    except Exception:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+async def trinity_update_result() -> dict:
+    return {"version": await trinity_version()}
+
+
+# Build is skipped because docker compose build doesn't work from inside a container.
+# If you need to rebuild images, use the /update-trinity skill or run manually on the DGX.
+job_engine.register(JobKind(
+    "trinity-update", "Pull latest Trinity from GitHub and restart containers",
+    [
+        JobStep(name="git_pull", argv=["git", "-C", TRINITY_DIR, "pull", "origin", "main"], timeout=60),
+        JobStep(name="compose_down", argv=["docker", "compose", "down"], cwd=TRINITY_DIR, timeout=30,
+                allow_failure=True),
+        JobStep(name="compose_up", argv=["docker", "compose", "up", "-d"], cwd=TRINITY_DIR, timeout=180),
+    ],
+    lock="trinity", finish=trinity_update_result
+))
+job_engine.register(JobKind(
+    "trinity-restart", "Restart all Trinity containers",
+    [JobStep(name="compose_restart", argv=["docker", "compose", "restart"], cwd=TRINITY_DIR, timeout=60)],
+    lock="trinity"
+))
+
 
 @app.get("/api/trinity/status")
 async def get_trinity_status():
     """Get Trinity-specific status including version"""
     services = []
+    try:
+        await cached_containers()
+    except Exception:
+        pass
+
     for name in TRINITY_SERVICES:
         container_name = name
-        try:
-            container = client.containers.get(container_name)
-            status = container.status
-        except docker.errors.NotFound:
-            status = "not found"
-        except Exception:
-            status = "error"
-
         services.append({
             "name": name.replace("trinity-", ""),
             "container": container_name,
-            "status": status,
+            "status": container_status(container_name),
         })
 
-    # Get git version
-    version = None
+    return {"services": services, "version": await trinity_version()}
+
+
+@app.post("/api/trinity/update", status_code=202)
+async def update_trinity():
+    """Start a trinity-update job; progress streams from /api/jobs/{id}/events"""
+    return job_engine.start("trinity-update").to_dict()
+
+
+@app.post("/api/trinity/restart", status_code=202)
+async def restart_trinity():
+    """Start a trinity-restart job"""
+    return job_engine.start("trinity-restart").to_dict()
+
+
+# ============ Shell Commands (Limited) ============
+
+# Whitelisted command -> the only extra arguments it may be given. Anything
+# else is refused: e.g. `nvidia-smi -f <path>` would write an arbitrary file.
+ALLOWED_COMMANDS = {
+    "nvidia-smi": {"-L", "-q"},
+    "df -h": {"/"},
+    "free -h": set(),
+    "uptime": {"-p", "-s"},
+    "docker stats --no-stream": set(),
+    "ollama list": set(),
+}
+ALLOWED_ARGV = [(shlex.split(command), extra) for command, extra in ALLOWED_COMMANDS.items()]
+
+EXEC_CACHE_TTL = float(os.environ.get("EXEC_CACHE_TTL", "5"))  # Seconds a finished command's output is reused
+EXEC_CHUNK_SIZE = 64 * 1024
+EXEC_OUTPUT_LIMIT = 4 * 1024 * 1024  # Output bytes kept per command; the rest is drained and dropped
+
+
+def parse_exec_command(command: str) -> list:
+    """Split a command into argv: a whitelisted command plus only its allowed extra arguments"""
     try:
-        result = subprocess.run(
-            ["git", "-C", os.path.expanduser("~/trinity"), "log", "-1", "--format=%h %s (%cr)"],
-            capture_output=True, text=True, timeout=5
+        argv = shlex.split(command)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid command: {e}")
+    if not any(
+        argv[:len(allowed)] == allowed and set(argv[len(allowed):]) <= extra
+        for allowed, extra in ALLOWED_ARGV
+    ):
+        raise HTTPException(
+            status_code=403,
+            detail=f"Command not allowed. Allowed: {list(ALLOWED_COMMANDS)}"
         )
-        if result.returncode == 0:
-            version = result.stdout.strip()
-    except Exception:
-        pass
+    return argv
 
-    return {"services": services, "version": version}
 
+class CommandRun:
+    """One execution of a whitelisted command, shared by every request for the same argv.
 
-@app.post("/api/trinity/update")
-async def update_trinity():
-    """Pull latest Trinity from GitHub and restart containers.
-    Note: Build is skipped because docker compose build doesn't work from inside a container.
-    If you need to rebuild images, use the /update-trinity skill or run manually on the DGX.
+    Output chunks go to a RunEventLog so streaming clients can join late and
+    replay from the start. The run belongs to no request: a client going
+    away does not stop it, the timeout does.
     """
-    trinity_dir = os.path.expanduser("~/trinity")
-    results = {"steps": [], "success": True, "error": None}
 
-    try:
-        # Step 1: Git pull
-        results["steps"].append({"name": "git_pull", "status": "running"})
-        pull_result = subprocess.run(
-            ["git", "-C", trinity_dir, "pull", "origin", "main"],
-            capture_output=True, text=True, timeout=60
-        )
-        if pull_result.returncode != 0:
-            results["steps"][-1]["status"] = "failed"
-            results["steps"][-1]["output"] = pull_result.stderr
-            results["success"] = False
-            results["error"] = "Git pull failed"
-            return results
-        results["steps"][-1]["status"] = "done"
-        results["steps"][-1]["output"] = pull_result.stdout.strip()
-
-        # Step 2: Restart containers (skip build - doesn't work from inside container)
-        results["steps"].append({"name": "restart", "status": "running"})
-        subprocess.run(
-            ["docker", "compose", "down"],
-            capture_output=True, timeout=30, cwd=trinity_dir
-        )
-        up_result = subprocess.run(
-            ["docker", "compose", "up", "-d"],
-            capture_output=True, text=True, timeout=180, cwd=trinity_dir
-        )
-        if up_result.returncode != 0:
-            results["steps"][-1]["status"] = "failed"
-            results["success"] = False
-            results["error"] = "Container restart failed"
-            return results
-        results["steps"][-1]["status"] = "done"
-
-        # Get new version
-        version_result = subprocess.run(
-            ["git", "-C", trinity_dir, "log", "-1", "--format=%h %s (%cr)"],
-            capture_output=True, text=True, timeout=5
-        )
-        results["version"] = version_result.stdout.strip() if version_result.returncode == 0 else None
+    def __init__(self, argv: list, timeout: float):
+        self.argv = argv
+        self.output = {"stdout": [], "stderr": []}
+        self.size = 0
+        self.truncated = False
+        self.returncode = None
+        self.error = None
+        self.finished_at = None
+        self.log = RunEventLog(os.path.join(RUN_LOG_DIR, f"exec-{uuid.uuid4().hex}.jsonl"))
+        self.task = asyncio.create_task(self._run(timeout))
+
+    def _record(self, stream: str, text: str):
+        if not text:
+            return
+        self.output[stream].append(text)
+        self.log.append(json_bytes({"type": "output", "stream": stream, "data": text}))
+
+    async def _pump(self, reader, stream: str):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while chunk := await reader.read(EXEC_CHUNK_SIZE):
+            # The limit counts raw output bytes, before decoding
+            remaining = EXEC_OUTPUT_LIMIT - self.size
+            if len(chunk) > remaining:
+                self.truncated = True
+                chunk = chunk[:remaining]
+            self.size += len(chunk)
+            self._record(stream, decoder.decode(chunk))
+        self._record(stream, decoder.decode(b"", final=True))
+
+    async def _run(self, timeout: float):
+        try:
+            async with _command_slots:
+                start = time.perf_counter()
+                process = await spawn_process(
+                    self.argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True
+                )
+                try:
+                    await asyncio.wait_for(
+                        asyncio.gather(
+                            self._pump(process.stdout, "stdout"), self._pump(process.stderr, "stderr"),
+                            process.wait()
+                        ),
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    kill_process_group(process)
+                    await process.wait()
+                    self.error = f"Command timed out after {timeout}s"
+                except asyncio.CancelledError:
+                    kill_process_group(process)
+                    raise
+                finally:
+                    observe_subprocess(self.argv, time.perf_counter() - start)
+            if self.error is None:
+                self.returncode = process.returncode
+        except asyncio.CancelledError:
+            self.error = "Cancelled"
+        except Exception as e:
+            self.error = str(e)
+        self.finished_at = time.time()
+        if self.error is not None:
+            self.log.append(json_bytes({"type": "error", "error": self.error}))
+        else:
+            self.log.append(json_bytes({"type": "exit", "returncode": self.returncode, "truncated": self.truncated}))
+        self.log.close()
 
-        return results
+    def fresh(self) -> bool:
+        return self.finished_at is None or time.time() - self.finished_at < EXEC_CACHE_TTL
 
-    except subprocess.TimeoutExpired:
-        results["success"] = False
-        results["error"] = "Operation timed out"
-        return results
-    except Exception as e:
-        results["success"] = False
-        results["error"] = str(e)
-        return results
+    def result(self, command: str) -> dict:
+        return {
+            "command": command,
+            "stdout": "".join(self.output["stdout"]),
+            "stderr": "".join(self.output["stderr"]),
+            "returncode": self.returncode,
+            "truncated": self.truncated,
+        }
 
 
-@app.post("/api/trinity/restart")
-async def restart_trinity():
-    """Restart all Trinity containers"""
-    trinity_dir = os.path.expanduser("~/trinity")
-    try:
-        subprocess.run(
-            ["docker", "compose", "restart"],
-            capture_output=True, timeout=60, cwd=trinity_dir
-        )
-        return {"success": True, "message": "Trinity restarted"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+command_runs = {}  # (argv tuple, timeout) -> CommandRun, while running and for EXEC_CACHE_TTL after
 
 
-# ============ Shell Commands (Limited) ============
+def shared_command_run(argv: list, timeout: float) -> tuple:
+    """The in-flight or recently finished run of `argv`, or a new one. Returns (run, reused).
+
+    Only callers asking for the same timeout share a run, so nobody inherits a shorter one.
+    """
+    key = (tuple(argv), timeout)
+    run = command_runs.get(key)
+    if run is not None and run.fresh():
+        return run, True
+    if run is not None:
+        run.log.discard()
+    run = CommandRun(argv, timeout)
+    command_runs[key] = run
+
+    def expire(_task):
+        # Failures are not cached; successful output is reused for EXEC_CACHE_TTL
+        delay = 0 if run.error is not None else EXEC_CACHE_TTL
+
+        def drop():
+            if command_runs.get(key) is run:
+                del command_runs[key]
+                run.log.discard()
+        asyncio.get_running_loop().call_later(delay, drop)
+
+    run.task.add_done_callback(expire)
+    return run, False
+
+
+@app.on_event("shutdown")
+async def cancel_command_runs():
+    for run in command_runs.values():
+        run.task.cancel()
+
+
+@app.post("/api/exec")
+async def exec_command(request: CommandRequest):
+    """Execute a whitelisted command.
+
+    Runs argv directly, without a shell. Identical commands within
+    EXEC_CACHE_TTL seconds share one execution.
+    """
+    cmd = request.command.strip()
+    run, reused = shared_command_run(parse_exec_command(cmd), request.timeout)
+    await asyncio.shield(run.task)
+    if run.error is not None:
+        raise HTTPException(status_code=500, detail=run.error)
+    return {**run.result(cmd), "cached": reused}
+
 
-ALLOWED_COMMANDS = [
-    "nvidia-smi",
-    "df -h",
-    "free -h",
-    "uptime",
-    "docker stats --no-stream",
-    "ollama list",
-]
+@app.post("/api/exec/stream")
+async def exec_command_stream(request: CommandRequest):
+    """Execute a whitelisted command, streaming stdout/stderr chunks over SSE as they arrive.
 
-@app.post("/api/exec")
-async def exec_command(request: CommandRequest):
-    """Execute a whitelisted command"""
-    cmd = request.command.strip()
+    Frames are {"type": "output", "stream", "data"} followed by
+    {"type": "exit", "returncode"} or {"type": "error", "error"}.
+    """
+    run, _ = shared_command_run(parse_exec_command(request.command.strip()), request.timeout)
 
-    # Check if command is allowed
-    if not any(cmd.startswith(allowed) for allowed in ALLOWED_COMMANDS):
-        raise HTTPException(
-            status_code=403,
-            detail=f"Command not allowed. Allowed: {ALLOWED_COMMANDS}"
-        )
+    async def generate():
+        async with aclosing(run.log.follow(0)) as events:
+            async for _, data in events:
+                yield sse_frame(data)
 
-    try:
-        result = subprocess.run(
-            cmd, shell=True,
-            capture_output=True, text=True,
-            timeout=request.timeout
-        )
-        return {
-            "command": cmd,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode,
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"  # Disable nginx buffering
         }
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail=f"Command timed out after {request.timeout}s")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    )
 
 
 # ============ Claude Code Integration ============
@@ -646,10 +3156,7 @@ async def exec_command(request: CommandRequest):
 async def claude_status():
     """Check if Claude Code is available"""
     try:
-        result = subprocess.run(
-            [CLAUDE_PATH, "--version"],
-            capture_output=True, text=True, timeout=5
-        )
+        result = await run_command([CLAUDE_PATH, "--version"], timeout=5)
         if result.returncode == 0:
             return {
                 "available": True,
@@ -683,14 +3190,9 @@ async def claude_chat(request: ClaudeCodeRequest):
         if request.allowed_tools:
             cmd.extend(["--allowedTools", ",".join(request.allowed_tools)])
 
-        # Run Claude Code with timeout (5 minutes max)
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300,
-            env={**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
-        )
+        # Run Claude Code with timeout (5 minutes max), behind the agent scheduler
+        async with agent_runtimes["sparky"].slot(PRIORITY_INTERACTIVE):
+            result = await run_command(cmd, timeout=300, env=agent_env(), limited=False)
 
         if result.returncode != 0:
             return {
@@ -721,310 +3223,1604 @@ async def claude_chat(request: ClaudeCodeRequest):
                 "is_error": False
             }
 
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="Claude Code request timed out (5 min limit)")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="Claude Code not installed")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except subprocess.TimeoutExpired:
+        raise HTTPException(status_code=504, detail="Claude Code request timed out (5 min limit)")
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Claude Code not installed")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ============ Session Management ============
+
+@app.get("/api/claude/sessions")
+async def list_sessions(limit: Optional[int] = Query(None, ge=1, le=PAGE_LIMIT_MAX), cursor: Optional[str] = None):
+    """List saved sessions, most recently updated first"""
+    return await list_agent_sessions("sparky", limit, cursor)
+
+
+@app.post("/api/claude/sessions")
+async def save_session(request: SaveSessionRequest):
+    """Save or update a session"""
+    return await save_agent_session("sparky", request)
+
+
+@app.delete("/api/claude/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Delete a saved session"""
+    return await delete_agent_session("sparky", session_id)
+
+
+# ============ File Upload ============
+
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.pdf'}
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_FIELD_LIMIT = 64 * 1024  # Non-file form fields
+RESUMABLE_UPLOAD_TTL = 24 * 3600  # Seconds an unfinished resumable upload is kept
+TUS_HEADERS = {"Tus-Resumable": "1.0.0"}
+
+
+def check_upload_agent(agent: str):
+    if agent not in UPLOAD_DIRS:
+        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}. Valid agents: {list(UPLOAD_DIRS.keys())}")
+
+
+def check_upload_type(filename: str):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type not allowed. Supported: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+
+
+def validate_upload(agent: str, filename: str) -> str:
+    """Check agent and file type; return the safe stored filename"""
+    check_upload_agent(agent)
+    check_upload_type(filename)
+    return os.path.basename(filename).replace(' ', '_')
+
+
+def file_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. Max size: {MAX_FILE_SIZE // (1024*1024)}MB")
+
+
+class UploadSink:
+    """Appends an upload to a staging file, enforcing a size limit and hashing as it goes.
+
+    Blocking file I/O; call from a worker thread.
+    """
+
+    def __init__(self, path: str, limit: int = MAX_FILE_SIZE, digest=None):
+        self.path = path
+        self.limit = limit
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+        self.digest = digest or hashlib.sha256()
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.limit:
+            raise file_too_large()
+        self.file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def commit(self, dest: str):
+        """fsync the data, then atomically rename it into place"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.path, dest)
+        fsync_dir(os.path.dirname(dest))
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MultipartUpload:
+    """Incremental multipart/form-data parser.
+
+    The `file` part streams straight into an UploadSink; other fields are
+    collected as (small) strings. Feed it request body chunks with write().
+    """
+
+    def __init__(self, boundary: bytes, staging_path: str):
+        self.staging_path = staging_path
+        self.fields = {}
+        self.filename = None
+        self.sink = None
+        self.file_complete = False  # The file part ended at its closing boundary
+        self._ended = False  # The parser reached the final --boundary--
+        self._headers = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._name = None
+        self._in_file = False
+        self._value = bytearray()
+        self.parser = MultipartParser(boundary, {
+            'on_part_begin': self._part_begin,
+            'on_header_field': self._header_field_data,
+            'on_header_value': self._header_value_data,
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+            'on_end': self._end,
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._in_file = False
+        self._value = bytearray()
+
+    def _header_field_data(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._name = options.get(b'name', b'').decode('utf-8', errors='replace')
+        if self._name == 'file' and self.sink is None:
+            self._in_file = True
+            self.filename = options.get(b'filename', b'').decode('utf-8', errors='replace')
+            # Reject a disallowed type before any of the body is stored
+            check_upload_type(self.filename)
+            self.sink = UploadSink(self.staging_path)
+
+    def _part_data(self, data, start, end):
+        if self._in_file:
+            self.sink.write(data[start:end])
+        else:
+            if len(self._value) + end - start > UPLOAD_FIELD_LIMIT:
+                raise HTTPException(status_code=413, detail=f"Form field too large: {self._name}")
+            self._value += data[start:end]
+
+    def _part_end(self):
+        if self._in_file:
+            self.file_complete = True
+        elif self._name:
+            self.fields[self._name] = self._value.decode('utf-8', errors='replace')
+
+    def _end(self):
+        self._ended = True
+
+    def write(self, chunk: bytes):
+        self.parser.write(chunk)
+
+    def finish(self):
+        """Check the body ended properly; a cut-off upload must not be stored"""
+        self.parser.finalize()
+        if not self._ended or (self.sink is not None and not self.file_complete):
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+
+
+# Uploads are content-addressed: each distinct file is stored once as
+# .blobs/<sha256> and every upload gets its own named hardlink to it, so the
+# blob's link count is its reference count and deleting one upload's name
+# never takes away another's.
+BLOB_DIR = ".blobs"
+upload_lock = threading.Lock()  # Serializes link/unlink against blob creation and removal
+
+
+def blob_path(agent: str, sha256: str) -> str:
+    return os.path.join(UPLOAD_DIRS[agent], BLOB_DIR, sha256[:2], sha256)
+
+
+def fsync_dir(path: str):
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def link_upload(agent: str, sha256: str, filename: str) -> str:
+    """A new named entry for a stored blob, owned by this upload alone"""
+    blob = blob_path(agent, sha256)
+    file_path = os.path.join(UPLOAD_DIRS[agent], f"{sha256[:8]}_{filename}")
+    if os.path.exists(file_path):
+        # Name taken, by an earlier upload of the same file or a prefix clash
+        file_path = os.path.join(UPLOAD_DIRS[agent], f"{sha256[:8]}_{str(uuid.uuid4())[:8]}_{filename}")
+    os.link(blob, file_path)
+    fsync_dir(UPLOAD_DIRS[agent])
+    return file_path
+
+
+def upload_info(agent: str, file_path: str, sha256: str, deduplicated: bool) -> dict:
+    return {
+        "success": True,
+        "filename": os.path.basename(file_path),
+        "path": file_path,
+        "size": os.path.getsize(file_path),
+        "sha256": sha256,
+        "deduplicated": deduplicated,
+        "agent": agent
+    }
+
+
+def find_upload(agent: str, sha256: str, filename: str) -> Optional[dict]:
+    """Link an already-stored blob under `filename`, if we have it"""
+    with upload_lock:
+        if not os.path.exists(blob_path(agent, sha256)):
+            return None
+        file_path = link_upload(agent, sha256, filename)
+    upload_catalogs[agent].record(os.path.basename(file_path), sha256)
+    return upload_info(agent, file_path, sha256, True)
+
+
+def store_upload(sink: UploadSink, agent: str, filename: str) -> dict:
+    """Move a completed staging file into the agent's blob store and name it"""
+    sha256 = sink.digest.hexdigest()
+    blob = blob_path(agent, sha256)
+    try:
+        with upload_lock:
+            deduplicated = os.path.exists(blob)
+            if deduplicated:
+                # Already stored: drop the new copy and just add a name
+                sink.discard()
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(sink.path, 0o444)  # Shared by every name; keep it immutable
+                sink.commit(blob)
+            file_path = link_upload(agent, sha256, filename)
+    except OSError as e:
+        sink.discard()
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    upload_catalogs[agent].record(os.path.basename(file_path), sha256)
+    return upload_info(agent, file_path, sha256, deduplicated)
+
+
+def remove_upload(file_path: str):
+    """Drop one named entry, and its blob once nothing else references it"""
+    with upload_lock:
+        stat = os.stat(file_path)
+        os.remove(file_path)
+        if stat.st_nlink != 2:
+            return
+        # The last remaining link is the blob itself; names start with its hash prefix
+        prefix = os.path.basename(file_path).split('_', 1)[0]
+        shard = os.path.join(os.path.dirname(file_path), BLOB_DIR, prefix[:2])
+        if len(prefix) != 8 or not os.path.isdir(shard):
+            return
+        for name in os.listdir(shard):
+            blob = os.path.join(shard, name)
+            if name.startswith(prefix) and os.stat(blob).st_ino == stat.st_ino:
+                os.remove(blob)
+                return
+
+
+@app.post("/api/upload")
+async def upload_file(request: Request, agent: Optional[str] = None):
+    """Upload a file for an agent to access.
+
+    Files are stored in the agent's uploads directory and can be referenced
+    in prompts. Supports images (jpg, png, gif, webp) and PDFs.
+
+    Takes multipart/form-data with a `file` part and an `agent` field (or
+    ?agent=). The body is streamed to disk as it arrives and rejected as
+    soon as it passes MAX_FILE_SIZE.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    if agent is not None:
+        check_upload_agent(agent)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + UPLOAD_FIELD_LIMIT:
+        raise file_too_large()
+
+    upload = MultipartUpload(options[b"boundary"], os.path.join(UPLOAD_STAGING_DIR, f"{uuid.uuid4().hex}.part"))
+    start, received = time.perf_counter(), 0
+    try:
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                await asyncio.to_thread(upload.write, chunk)
+            upload.finish()
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="Malformed multipart body")
+        if upload.sink is None:
+            raise HTTPException(status_code=400, detail="No file in upload")
+        agent = agent or upload.fields.get("agent", "sparky")
+        filename = validate_upload(agent, upload.filename)
+        return await asyncio.to_thread(store_upload, upload.sink, agent, filename)
+    finally:
+        observe_upload("multipart", received, time.perf_counter() - start)
+        if upload.sink is not None and os.path.exists(upload.sink.path):
+            upload.sink.discard()
+
+
+# Resumable uploads follow the tus 1.0 core protocol: POST creates an upload
+# with Upload-Length, HEAD reports Upload-Offset, PATCH appends from that
+# offset. Unlike tus, the final PATCH answers 200 with the stored file info.
+
+resumable_digests = {}  # upload_id -> running sha256 for the bytes already received
+resumable_active = set()  # upload_ids with a PATCH in progress
+
+
+def resumable_paths(upload_id: str) -> tuple:
+    if not upload_id.isalnum():
+        raise HTTPException(status_code=404, detail="Upload not found")
+    base = os.path.join(UPLOAD_STAGING_DIR, upload_id)
+    return base + ".part", base + ".json"
+
+
+def save_resumable(upload_id: str, meta: dict):
+    """Write a new upload's metadata and empty data file; call from a worker thread"""
+    data_path, meta_path = resumable_paths(upload_id)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    open(data_path, 'wb').close()
+
+
+def load_resumable(upload_id: str) -> dict:
+    """An upload's metadata plus its current offset; call from a worker thread"""
+    data_path, meta_path = resumable_paths(upload_id)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    meta["offset"] = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+    return meta
+
+
+def remove_resumable(upload_id: str):
+    for path in resumable_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def resumable_digest(upload_id: str, data_path: str):
+    """The running hash for an upload, rebuilt from disk after a restart or failed chunk"""
+    digest = resumable_digests.pop(upload_id, None)
+    if digest is None:
+        digest = hashlib.sha256()
+        if os.path.exists(data_path):
+            with open(data_path, 'rb') as f:
+                while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+    return digest
+
+
+def parse_upload_metadata(header: str) -> dict:
+    """tus Upload-Metadata: comma-separated `key base64value` pairs"""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in header.split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value).decode('utf-8') if value else ""
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for {key}")
+    return metadata
+
+
+def prune_resumable_uploads():
+    """Remove staging files for uploads abandoned longer than RESUMABLE_UPLOAD_TTL"""
+    cutoff = time.time() - RESUMABLE_UPLOAD_TTL
+    for name in os.listdir(UPLOAD_STAGING_DIR):
+        path = os.path.join(UPLOAD_STAGING_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+@app.on_event("startup")
+async def start_upload_pruning():
+    await asyncio.to_thread(prune_resumable_uploads)
+
+
+@app.post("/api/upload/resumable", status_code=201)
+async def create_resumable_upload(request: Request):
+    """Start a resumable upload. Needs Upload-Length and Upload-Metadata
+    with `filename` and optionally `agent` and `sha256`.
+
+    If `sha256` matches a file the agent already has, nothing needs to be
+    sent: the response is 200 with the stored file instead of 201.
+    """
+    length = request.headers.get("upload-length", "")
+    if not length.isdigit():
+        raise HTTPException(status_code=400, detail="Upload-Length required")
+    if int(length) > MAX_FILE_SIZE:
+        raise file_too_large()
+    metadata = parse_upload_metadata(request.headers.get("upload-metadata", ""))
+    agent = metadata.get("agent", "sparky")
+    filename = validate_upload(agent, metadata.get("filename", ""))
+    sha256 = metadata.get("sha256", "").lower()
+    if len(sha256) == 64 and all(c in "0123456789abcdef" for c in sha256):
+        existing = await asyncio.to_thread(find_upload, agent, sha256, filename)
+        if existing is not None:
+            return Response(content=json_bytes(existing), media_type="application/json",
+                            headers={**TUS_HEADERS, "Upload-Offset": length})
+
+    upload_id = uuid.uuid4().hex
+    meta = {"agent": agent, "filename": filename, "length": int(length), "created": time.time()}
+    await asyncio.to_thread(save_resumable, upload_id, meta)
+    return Response(status_code=201, headers={
+        **TUS_HEADERS,
+        "Location": f"/api/upload/resumable/{upload_id}",
+        "Upload-Offset": "0",
+    })
+
+
+@app.head("/api/upload/resumable/{upload_id}")
+async def resumable_upload_offset(upload_id: str):
+    """How much of the upload the server has, so the client knows where to resume"""
+    meta = await asyncio.to_thread(load_resumable, upload_id)
+    return Response(headers={
+        **TUS_HEADERS,
+        "Upload-Offset": str(meta["offset"]),
+        "Upload-Length": str(meta["length"]),
+        "Cache-Control": "no-store",
+    })
+
+
+@app.patch("/api/upload/resumable/{upload_id}")
+async def append_resumable_upload(upload_id: str, request: Request):
+    """Append a chunk at Upload-Offset. Returns 204 with the new offset, or
+    200 with the stored file once the last byte arrives."""
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    meta = await asyncio.to_thread(load_resumable, upload_id)
+    if request.headers.get("upload-offset") != str(meta["offset"]):
+        raise HTTPException(status_code=409, detail=f"Upload-Offset mismatch, server has {meta['offset']}")
+    if upload_id in resumable_active:
+        raise HTTPException(status_code=409, detail="Upload already in progress")
+
+    resumable_active.add(upload_id)
+    data_path, meta_path = resumable_paths(upload_id)
+    sink = None
+    start, received = time.perf_counter(), 0
+    try:
+        digest = await asyncio.to_thread(resumable_digest, upload_id, data_path)
+        sink = await asyncio.to_thread(UploadSink, data_path, meta["length"], digest)
+        async for chunk in request.stream():
+            received += len(chunk)
+            if sink.size + len(chunk) > meta["length"]:
+                raise HTTPException(status_code=400, detail=f"Chunk exceeds Upload-Length of {meta['length']} bytes")
+            await asyncio.to_thread(sink.write, chunk)
+        if sink.size < meta["length"]:
+            sink.close()
+            resumable_digests[upload_id] = sink.digest
+            return Response(status_code=204, headers={**TUS_HEADERS, "Upload-Offset": str(sink.size)})
+        result = await asyncio.to_thread(store_upload, sink, meta["agent"], meta["filename"])
+        await asyncio.to_thread(os.remove, meta_path)
+        return Response(content=json_bytes(result), media_type="application/json",
+                        headers={**TUS_HEADERS, "Upload-Offset": str(sink.size)})
+    finally:
+        observe_upload("resumable", received, time.perf_counter() - start)
+        resumable_active.discard(upload_id)
+        if sink is not None and not sink.file.closed:
+            # Connection dropped mid-chunk: keep what was written, rehash on resume
+            sink.close()
+
+
+@app.delete("/api/upload/resumable/{upload_id}", status_code=204)
+async def cancel_resumable_upload(upload_id: str):
+    """Abandon a resumable upload and delete what was received"""
+    await asyncio.to_thread(load_resumable, upload_id)
+    resumable_digests.pop(upload_id, None)
+    await asyncio.to_thread(remove_resumable, upload_id)
+    return Response(status_code=204, headers=TUS_HEADERS)
+
+
+@app.get("/api/uploads/{agent}")
+async def list_uploads(agent: str, sort: str = "modified", order: str = "desc", prefix: Optional[str] = None,
+                       limit: Optional[int] = Query(None, ge=1, le=PAGE_LIMIT_MAX), offset: int = Query(0, ge=0)):
+    """List uploaded files for an agent from the upload catalog"""
+    if agent not in UPLOAD_DIRS:
+        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}")
+
+    upload_dir = UPLOAD_DIRS[agent]
+    try:
+        page = await asyncio.to_thread(
+            upload_catalogs[agent].list, sort, order != "asc", prefix, limit, offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    files = [
+        {
+            "name": f["name"],
+            "path": os.path.join(upload_dir, f["name"]),
+            "size": f["size"],
+            "modified": f["mtime"],
+            "sha256": f["sha256"],
+            "mime": f["mime"]
+        }
+        for f in page["files"]
+    ]
+    return {"files": files, "total": page["total"], "agent": agent}
+
+
+@app.api_route("/api/uploads/{agent}/{filename}", methods=["GET", "HEAD"])
+async def download_upload(agent: str, filename: str, request: Request, download: bool = False):
+    """Serve an uploaded file, with Range and conditional request support"""
+    if agent not in UPLOAD_DIRS:
+        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}")
+    return await serve_file(request, resolve_served_file(UPLOAD_DIRS[agent], filename), download=download)
+
+
+@app.delete("/api/uploads/{agent}/{filename}")
+async def delete_upload(agent: str, filename: str):
+    """Delete an uploaded file"""
+    if agent not in UPLOAD_DIRS:
+        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}")
+
+    upload_dir = UPLOAD_DIRS[agent]
+    file_path = os.path.join(upload_dir, filename)
+
+    # Security check - ensure we're not deleting outside uploads dir
+    real_path = os.path.realpath(file_path)
+    if not real_path.startswith(os.path.realpath(upload_dir)):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        # Only drops this name; the stored content goes once no other name uses it
+        await asyncio.to_thread(remove_upload, file_path)
+        await asyncio.to_thread(upload_catalogs[agent].forget, filename)
+        return {"success": True, "deleted": filename}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete: {str(e)}")
+
+
+# ============ Claude Code Worker Pool ============
+
+# Idle Claude Code processes kept per working directory (0 disables the pool)
+CLAUDE_POOL_SIZE = int(os.environ.get("CLAUDE_POOL_SIZE", "1"))
+CLAUDE_POOL_IDLE_TIMEOUT = int(os.environ.get("CLAUDE_POOL_IDLE_TIMEOUT", "600"))  # Reap session workers idle this long
+CLAUDE_POOL_MAX_LIFETIME = int(os.environ.get("CLAUDE_POOL_MAX_LIFETIME", "3600"))  # Recycle workers older than this
+CLAUDE_POOL_MAX_SESSIONS = int(os.environ.get("CLAUDE_POOL_MAX_SESSIONS", "4"))  # Session-bound workers kept per pool
+AGENT_STREAM_LIMIT = 16 * 1024 * 1024  # stream-json lines carry whole tool results
+
+
+def agent_env() -> dict:
+    """Environment for agent CLIs, with ~/.local/bin on PATH"""
+    return {**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
+
+
+class ClaudeWorker:
+    """A Claude Code process in stream-json input mode, serving one turn at a time.
+
+    The process is started ahead of the first message, so node startup and
+    session resume are paid before the user is waiting. Each turn writes one
+    user message to stdin and reads events until the turn's result event.
+    """
+
+    def __init__(self, binary: str, cwd: str, session_id: Optional[str] = None,
+                 allowed_tools: Optional[List[str]] = None, env: Optional[dict] = None):
+        self.binary = binary
+        self.cwd = cwd
+        self.env = env
+        self.session_id = session_id
+        self.allowed_tools = allowed_tools
+        self.process = None
+        self.stderr_tail = deque(maxlen=50)
+        self.started_at = time.time()
+        self.last_used = self.started_at
+        self._stderr_task = None
+
+    async def start(self):
+        cmd = [
+            self.binary,
+            "-p",
+            "--input-format", "stream-json",
+            "--output-format", "stream-json",
+            "--verbose",  # Required when using stream-json with --print
+            "--dangerously-skip-permissions"  # YOLO mode - no approval needed
+        ]
+        if self.session_id:
+            cmd.extend(["--resume", self.session_id])
+        if self.allowed_tools:
+            cmd.extend(["--allowedTools", ",".join(self.allowed_tools)])
+
+        self.process = await spawn_process(
+            cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env or agent_env(),
+            start_new_session=True,
+            limit=AGENT_STREAM_LIMIT
+        )
+        # Drain stderr continuously so a chatty process can't block on a full pipe
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        return self
+
+    async def _drain_stderr(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                break
+            self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def expired(self, now: float) -> bool:
+        return now - self.started_at > CLAUDE_POOL_MAX_LIFETIME
+
+    async def turn(self, message: str):
+        """Send one user message; yield each stdout line as a parsed event, or as
+        text if it isn't JSON, until the turn's result event or process exit."""
+        self.last_used = time.time()
+        payload = {
+            "type": "user",
+            "message": {"role": "user", "content": message},
+            "parent_tool_use_id": None,
+            "session_id": self.session_id or "",
+        }
+        self.process.stdin.write(json_bytes(payload) + b"\n")
+        await self.process.stdin.drain()
+
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                # Process exited mid-turn; let stderr finish draining for the caller
+                await self.process.wait()
+                await asyncio.wait([self._stderr_task], timeout=1)
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json_loads(line)
+            except ValueError:
+                yield line.decode('utf-8', errors='replace')
+                continue
+            if event.get('session_id'):
+                self.session_id = event['session_id']
+            yield event
+            if event.get('type') == 'result':
+                self.last_used = time.time()
+                return
+
+    async def terminate(self):
+        """Stop the worker mid-turn, including any tools it spawned"""
+        if self.alive:
+            await terminate_process_group(self.process)
+
+    async def close(self, grace: float = 5):
+        """Close stdin so the CLI exits cleanly, killing it after `grace` seconds"""
+        if not self.alive:
+            return
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), timeout=grace)
+        except (asyncio.TimeoutError, ConnectionError):
+            kill_process_group(self.process)
+            await self.process.wait()
+
+
+class ClaudeWorkerPool:
+    """Warm Claude Code workers for one agent working directory.
+
+    Keeps CLAUDE_POOL_SIZE fresh workers ready for new conversations. After a
+    turn, the worker stays bound to its session (up to CLAUDE_POOL_MAX_SESSIONS)
+    so the next message in that conversation skips both startup and resume.
+    Idle session workers are reaped and all workers recycled after
+    CLAUDE_POOL_MAX_LIFETIME.
+    """
+
+    def __init__(self, binary: str, cwd: str, size: int = CLAUDE_POOL_SIZE, env: Optional[dict] = None):
+        self.binary = binary
+        self.cwd = cwd
+        self.size = size
+        self.env = env
+        self.fresh = []  # Started workers with no session yet
+        self.sessions = {}  # session_id -> idle worker bound to that session
+        self._spawning = 0
+        self._reaper = None
+
+    async def _spawn_fresh(self):
+        self._spawning += 1
+        try:
+            worker = await ClaudeWorker(self.binary, self.cwd, env=self.env).start()
+            self.fresh.append(worker)
+        except Exception:
+            pass
+        finally:
+            self._spawning -= 1
+
+    def refill(self):
+        """Start workers in the background until `size` fresh ones are ready"""
+        if not os.path.isdir(self.cwd):
+            return
+        for _ in range(self.size - len(self.fresh) - self._spawning):
+            asyncio.create_task(self._spawn_fresh())
+
+    async def acquire(self, session_id: Optional[str] = None,
+                      allowed_tools: Optional[List[str]] = None) -> ClaudeWorker:
+        """A worker for this conversation: the session's warm worker, a fresh one
+        for a new conversation, or a newly started one as a cold fallback."""
+        now = time.time()
+        worker = None
+        if allowed_tools:
+            # Tool restrictions are fixed at process start, so these never share workers
+            return await ClaudeWorker(self.binary, self.cwd, session_id, allowed_tools, self.env).start()
+        if session_id:
+            worker = self.sessions.pop(session_id, None)
+        else:
+            while self.fresh and worker is None:
+                candidate = self.fresh.pop(0)
+                if candidate.alive and not candidate.expired(now):
+                    worker = candidate
+                else:
+                    asyncio.create_task(candidate.close())
+            self.refill()
+        if worker is not None and (not worker.alive or worker.expired(now)):
+            asyncio.create_task(worker.close())
+            worker = None
+        if worker is None:
+            worker = await ClaudeWorker(self.binary, self.cwd, session_id, env=self.env).start()
+        return worker
+
+    def release(self, worker: ClaudeWorker, reusable: bool = True):
+        """Return a worker after its turn; it stays bound to its session if reusable"""
+        if (not reusable or self.size <= 0 or worker.allowed_tools or not worker.alive
+                or not worker.session_id or worker.expired(time.time())):
+            asyncio.create_task(worker.close())
+            return
+        previous = self.sessions.pop(worker.session_id, None)
+        if previous is not None and previous is not worker:
+            asyncio.create_task(previous.close())
+        self.sessions[worker.session_id] = worker
+        while len(self.sessions) > CLAUDE_POOL_MAX_SESSIONS:
+            oldest = min(self.sessions, key=lambda sid: self.sessions[sid].last_used)
+            asyncio.create_task(self.sessions.pop(oldest).close())
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(30)
+            now = time.time()
+            for session_id, worker in list(self.sessions.items()):
+                if (not worker.alive or worker.expired(now)
+                        or now - worker.last_used > CLAUDE_POOL_IDLE_TIMEOUT):
+                    del self.sessions[session_id]
+                    asyncio.create_task(worker.close())
+            for worker in list(self.fresh):
+                if not worker.alive or worker.expired(now):
+                    self.fresh.remove(worker)
+                    asyncio.create_task(worker.close())
+            self.refill()
+
+    def start(self):
+        if self.size > 0 and self._reaper is None:
+            self.refill()
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        workers = self.fresh + list(self.sessions.values())
+        self.fresh, self.sessions = [], {}
+        await asyncio.gather(*(w.close() for w in workers), return_exceptions=True)
+
+
+# ============ Agent Scheduler ============
+
+AGENT_MAX_CONCURRENT = int(os.environ.get("AGENT_MAX_CONCURRENT", "3"))  # Agent processes running at once, all agents
+AGENT_MIN_FREE_MEMORY = int(os.environ.get("AGENT_MIN_FREE_MEMORY_MB", "2048")) * 1024 * 1024
+AGENT_MEMORY_RETRY = 2  # Seconds between admission retries while memory is short
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_RESEARCH = 1
+PRIORITY_BACKGROUND = 2
+
+
+class QueueCancelled(Exception):
+    """A queued job was withdrawn before it started"""
+
+
+class SchedulerTicket:
+    def __init__(self, agent: str, limit: int, priority: int, seq: int, owner=None):
+        self.agent = agent
+        self.limit = limit
+        self.priority = priority
+        self.seq = seq
+        self.owner = owner
+        self.position = None
+        self.admitted = False
+        self.cancelled = False
+        self.changed = asyncio.Event()  # Set on admission, cancellation or a new queue position
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AgentScheduler:
+    """Admission control for agent processes.
+
+    Jobs queue FIFO within priority classes and start when the global cap,
+    their agent's cap and host free memory allow. With nothing running a job
+    is admitted regardless of memory, so a busy host can't stall the queue.
+    """
+
+    def __init__(self, max_running: int = AGENT_MAX_CONCURRENT, min_free_memory: int = AGENT_MIN_FREE_MEMORY):
+        self.max_running = max_running
+        self.min_free_memory = min_free_memory
+        self.queue = []  # Heap of waiting tickets
+        self.running = {}  # agent -> running job count
+        self.total_running = 0
+        self._seq = 0
+        self._retry = None
+
+    def _memory_available(self) -> bool:
+        return self.total_running == 0 or psutil.virtual_memory().available >= self.min_free_memory
+
+    def _dispatch(self):
+        """Admit waiting tickets in priority order, then renumber the rest"""
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        waiting = []
+        memory_short = False
+        for ticket in sorted(self.queue):
+            if self.total_running >= self.max_running or self.running.get(ticket.agent, 0) >= ticket.limit:
+                waiting.append(ticket)
+            elif memory_short or not self._memory_available():
+                memory_short = True
+                waiting.append(ticket)
+            else:
+                ticket.admitted = True
+                self.running[ticket.agent] = self.running.get(ticket.agent, 0) + 1
+                self.total_running += 1
+                ticket.changed.set()
+        if len(waiting) != len(self.queue):
+            self.queue = waiting
+            heapq.heapify(self.queue)
+        for position, ticket in enumerate(waiting, start=1):
+            if ticket.position != position:
+                ticket.position = position
+                ticket.changed.set()
+        if memory_short:
+            # Memory frees up without an event we could wait on, so poll
+            self._retry = asyncio.get_running_loop().call_later(AGENT_MEMORY_RETRY, self._dispatch)
+
+    def _release(self, ticket: SchedulerTicket):
+        self.running[ticket.agent] -= 1
+        self.total_running -= 1
+        self._dispatch()
+
+    def withdraw(self, owner):
+        """Cancel the queued ticket belonging to `owner`, if it hasn't started yet"""
+        for ticket in self.queue:
+            if ticket.owner is owner:
+                ticket.cancelled = True
+                ticket.changed.set()
+
+    @asynccontextmanager
+    async def slot(self, agent: str, limit: int, priority: int = PRIORITY_INTERACTIVE,
+                   owner=None, on_queued=None):
+        """Hold a run slot for `agent` for the body of the block.
+
+        `on_queued(position)` is called whenever the job's queue position
+        changes while it waits. Raises QueueCancelled if withdrawn.
+        """
+        self._seq += 1
+        ticket = SchedulerTicket(agent, limit, priority, self._seq, owner)
+        heapq.heappush(self.queue, ticket)
+        self._dispatch()
+        reported = None
+        try:
+            while not ticket.admitted:
+                if ticket.cancelled:
+                    raise QueueCancelled()
+                if on_queued is not None and ticket.position != reported:
+                    reported = ticket.position
+                    on_queued(reported)
+                ticket.changed.clear()
+                await ticket.changed.wait()
+        except BaseException:
+            if ticket.admitted:
+                self._release(ticket)
+            else:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self._dispatch()
+            raise
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def status(self) -> dict:
+        return {
+            "max_running": self.max_running,
+            "running": {agent: count for agent, count in self.running.items() if count},
+            "queued": [
+                {"agent": t.agent, "priority": t.priority, "position": t.position}
+                for t in sorted(self.queue)
+            ],
+            "memory_available": psutil.virtual_memory().available,
+            "min_free_memory": self.min_free_memory,
+        }
+
+
+agent_scheduler = AgentScheduler()
+
+
+# ============ Agent Runs ============
+
+# Seconds an agent process group gets after SIGTERM before SIGKILL
+AGENT_KILL_GRACE = float(os.environ.get("AGENT_KILL_GRACE", "5"))
+RUN_LOG_DIR = os.path.expanduser("~/.dgx-web-ui-runs")
+RUN_LOG_MEMORY_EVENTS = 500  # Events per run kept in memory before spilling to disk
+RUN_DETACHED_GRACE = int(os.environ.get("RUN_DETACHED_GRACE", "120"))  # Seconds a run survives with no client
+RUN_RETENTION = int(os.environ.get("RUN_RETENTION", "600"))  # Seconds a finished run stays replayable
+
+
+async def terminate_process_group(process, grace: float = AGENT_KILL_GRACE):
+    """SIGTERM a child's process group, escalating to SIGKILL after `grace` seconds"""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    try:
+        await asyncio.wait_for(process.wait(), timeout=grace)
+    except asyncio.TimeoutError:
+        kill_process_group(process)
+        await process.wait()
+
+
+class RunEventLog:
+    """Append-only log of serialized events (JSON bytes) for one run.
+
+    Events are numbered from 0. The newest RUN_LOG_MEMORY_EVENTS stay in memory;
+    older ones are spilled, in order, to a file so long runs stay replayable
+    without growing the process.
+    """
+
+    def __init__(self, path: str, memory_limit: int = None):
+        self.path = path
+        self.memory_limit = memory_limit or RUN_LOG_MEMORY_EVENTS
+        self.memory = []
+        self.memory_start = 0  # Id of memory[0]; ids below it are on disk
+        self.length = 0
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, data: bytes) -> int:
+        self.memory.append(data)
+        self.length += 1
+        if len(self.memory) > self.memory_limit:
+            self._spill(len(self.memory) // 2)
+        self._notify()
+        return self.length - 1
+
+    def _spill(self, count: int):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.writelines(data + b"\n" for data in self.memory[:count])
+        self.memory = self.memory[count:]
+        self.memory_start += count
+
+    def read(self, start: int) -> list:
+        """(id, data) pairs for every event from `start` on"""
+        events = []
+        if start < self.memory_start:
+            with open(self.path, 'rb') as f:
+                for event_id, line in enumerate(f):
+                    if event_id >= self.memory_start:
+                        break
+                    if event_id >= start:
+                        events.append((event_id, line.rstrip(b"\n")))
+        offset = max(start - self.memory_start, 0)
+        events.extend(
+            (self.memory_start + i, data) for i, data in enumerate(self.memory[offset:], start=offset)
+        )
+        return events
+
+    def flush(self):
+        """Write every in-memory event to the file, e.g. to keep the log after the run"""
+        if self.memory:
+            self._spill(len(self.memory))
+
+    @classmethod
+    def load(cls, path: str) -> "RunEventLog":
+        """A closed log over a previously flushed file"""
+        log = cls(path)
+        try:
+            with open(path, 'rb') as f:
+                log.length = sum(1 for _ in f)
+        except FileNotFoundError:
+            pass
+        log.memory_start = log.length
+        log.closed = True
+        return log
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    async def follow(self, start: int = 0):
+        """Replay from `start`, then yield live events until the log is closed"""
+        next_id = start
+        while True:
+            changed = self._changed
+            for event_id, data in self.read(next_id):
+                yield event_id, data
+                next_id = event_id + 1
+            if next_id < self.length:
+                continue
+            if self.closed:
+                return
+            await changed.wait()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AgentRun:
+    """One agent turn, running independently of any HTTP connection.
 
+    The run writes its SSE payloads to a RunEventLog. Clients attach and detach
+    freely and can resume from an event id. A run nobody has watched for
+    RUN_DETACHED_GRACE seconds is cancelled; a finished run stays replayable
+    for RUN_RETENTION seconds.
+    """
 
-# ============ Session Management ============
+    def __init__(self, agent: str, session_id: Optional[str] = None):
+        self.run_id = uuid.uuid4().hex
+        self.agent = agent
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.finished_at = None
+        self.worker = None
+        self.cancelled = False
+        self.task = None
+        self.log = RunEventLog(os.path.join(RUN_LOG_DIR, f"{self.run_id}.jsonl"))
+        self.subscribers = 0
+        self._detach_timer = None
+        self._first_output = False
+
+    def emit(self, payload: dict):
+        self.log.append(json_bytes(payload))
+
+    def mark_first_output(self):
+        if not self._first_output:
+            self._first_output = True
+            AGENT_FIRST_OUTPUT_SECONDS.labels(self.agent).observe(time.time() - self.started_at)
+
+    def attach(self, worker: ClaudeWorker):
+        self.worker = worker
+        if self.cancelled:
+            asyncio.create_task(worker.terminate())
+
+    def cancel(self):
+        """Terminate the run's process group; the log then ends with a cancelled event"""
+        self.cancelled = True
+        agent_scheduler.withdraw(self)
+        if self.worker is not None:
+            asyncio.create_task(self.worker.terminate())
+
+    def finish(self, failed: bool = False):
+        """Close the log; `failed` marks runs that ended with an error event (timeouts included)"""
+        self.finished_at = time.time()
+        self.log.close()
+        outcome = "failed" if failed else "cancelled" if self.cancelled else "completed"
+        AGENT_RUN_SECONDS.labels(self.agent, outcome).observe(self.finished_at - self.started_at)
+        if self._detach_timer is not None:
+            self._detach_timer.cancel()
+        asyncio.get_running_loop().call_later(RUN_RETENTION, self.discard)
+
+    def discard(self):
+        agent_runs.pop(self.run_id, None)
+        self.log.discard()
+
+    async def stream(self, start: int = 0):
+        """SSE frames from event `start` on, following the run until it finishes"""
+        self.subscribers += 1
+        if self._detach_timer is not None:
+            self._detach_timer.cancel()
+            self._detach_timer = None
+        try:
+            async with aclosing(self.log.follow(start)) as events:
+                async for event_id, data in events:
+                    yield sse_frame(data, event_id)
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and self.finished_at is None:
+                # Nobody is watching: give clients a chance to reconnect, then stop the agent
+                self._detach_timer = asyncio.get_running_loop().call_later(RUN_DETACHED_GRACE, self.cancel)
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "agent": self.agent,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cancelled": self.cancelled,
+            "events": self.log.length,
+            "subscribers": self.subscribers,
+        }
 
-@app.get("/api/claude/sessions")
-async def list_sessions():
-    """List all saved sessions"""
-    data = load_sessions()
-    return {"sessions": data.get("sessions", [])}
 
+agent_runs = {}  # run_id -> AgentRun
 
-@app.post("/api/claude/sessions")
-async def save_session(request: SaveSessionRequest):
-    """Save or update a session"""
-    from datetime import datetime
 
-    data = load_sessions()
-    sessions = data.get("sessions", [])
+def start_agent_run(agent: str, request: BaseModel, execute) -> AgentRun:
+    """Register a run and start `execute(run, request)` in the background"""
+    run = AgentRun(agent, getattr(request, "session_id", None))
+    agent_runs[run.run_id] = run
+    run.task = asyncio.create_task(execute(run, request))
+    return run
 
-    # Check if session already exists
-    existing = next((s for s in sessions if s["session_id"] == request.session_id), None)
 
-    if existing:
-        # Update existing session
-        existing["name"] = request.name
-        existing["updated_at"] = datetime.now().isoformat()
-        if request.first_message:
-            existing["first_message"] = request.first_message
-    else:
-        # Add new session
-        sessions.append({
-            "session_id": request.session_id,
-            "name": request.name,
-            "first_message": request.first_message or "",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        })
+def run_stream_response(run: AgentRun, start: int = 0) -> StreamingResponse:
+    return StreamingResponse(
+        run.stream(start),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"  # Disable nginx buffering
+        }
+    )
 
-    data["sessions"] = sessions
-    save_sessions(data)
-    return {"success": True, "session_id": request.session_id}
 
+@app.on_event("shutdown")
+async def cancel_agent_runs():
+    for run in list(agent_runs.values()):
+        if run.finished_at is None:
+            run.cancel()
 
-@app.delete("/api/claude/sessions/{session_id}")
-async def delete_session(session_id: str):
-    """Delete a saved session"""
-    data = load_sessions()
-    sessions = data.get("sessions", [])
 
-    original_count = len(sessions)
-    sessions = [s for s in sessions if s["session_id"] != session_id]
+@app.get("/api/agents/runs")
+async def list_agent_runs():
+    """List running and recently finished agent runs"""
+    return {"runs": [run.to_dict() for run in agent_runs.values()], "scheduler": agent_scheduler.status()}
 
-    if len(sessions) == original_count:
-        raise HTTPException(status_code=404, detail="Session not found")
 
-    data["sessions"] = sessions
-    save_sessions(data)
-    return {"success": True, "deleted": session_id}
+@app.get("/api/agents/runs/{run_id}/events")
+async def agent_run_events(run_id: str, request: Request, after: Optional[int] = None):
+    """Attach to a run's event stream.
 
+    Replays events after the SSE Last-Event-ID header (or `after`), then
+    follows the run live. Any number of clients can attach to the same run.
+    """
+    run = agent_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    last_event_id = request.headers.get("last-event-id")
+    if after is None and last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return run_stream_response(run, start=0 if after is None else after + 1)
 
-# ============ File Upload ============
 
-ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.pdf'}
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+@app.post("/api/agents/runs/{run_id}/cancel")
+async def cancel_agent_run(run_id: str):
+    """Cancel a running agent turn and kill its process"""
+    run = agent_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    run.cancel()
+    return {"success": True, "run_id": run_id}
 
-@app.post("/api/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    agent: str = Form(default="sparky")
-):
-    """Upload a file for an agent to access.
 
-    Files are stored in the agent's uploads directory and can be referenced
-    in prompts. Supports images (jpg, png, gif, webp) and PDFs.
-    """
-    # Validate agent
-    if agent not in UPLOAD_DIRS:
-        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}. Valid agents: {list(UPLOAD_DIRS.keys())}")
+# ============ Agent Runtime ============
 
-    upload_dir = UPLOAD_DIRS[agent]
+class AgentConfig(BaseModel):
+    """How to launch one agent CLI"""
+    name: str
+    label: str  # Shown in init/error messages
+    binary: str
+    cwd: str
+    env: dict = {}  # Added on top of agent_env()
+    allowed_tools: Optional[List[str]] = None  # Default tool restriction, if any
+    pool_size: int = CLAUDE_POOL_SIZE
+    timeout: int = 1800  # Seconds a single turn may run
+    max_concurrent: int = 2  # Turns of this agent running at once
+
+
+class StreamJsonTranslator:
+    """Translates one turn of Claude Code stream-json events into SSE payloads.
+
+    Events arrive already decoded (once, by ClaudeWorker.turn). Payloads are
+    assembled as bytes from fixed fragments plus json_bytes of each value, with
+    the session_id tail encoded once per session rather than per event; no
+    intermediate dict is built. Event types dispatch through a table built
+    once for the class, so the per-event cost stays flat.
+    """
 
-    # Validate file extension
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File type not allowed. Supported: {', '.join(ALLOWED_EXTENSIONS)}"
+    def __init__(self, session_id: Optional[str] = None, start_time: Optional[float] = None):
+        self.start_time = start_time or time.time()
+        self.completed = False
+        self.session_id = session_id
+
+    @property
+    def session_id(self) -> Optional[str]:
+        return self._session_id
+
+    @session_id.setter
+    def session_id(self, value: Optional[str]):
+        self._session_id = value
+        self._tail = b',"session_id":' + json_bytes(value) + b'}'
+
+    def _elapsed_ms(self) -> int:
+        return int((time.time() - self.start_time) * 1000)
+
+    def init(self, message: str, run_id: str) -> bytes:
+        return b'{"type":"init","message":' + json_bytes(message) + b',"run_id":' + json_bytes(run_id) + b'}'
+
+    def message(self, text: str) -> bytes:
+        return b'{"type":"message","text":' + json_bytes(text) + self._tail
+
+    def error(self, error: str) -> bytes:
+        return b'{"type":"error","error":' + json_bytes(error) + self._tail
+
+    def cancelled(self) -> bytes:
+        return b'{"type":"cancelled"' + self._tail
+
+    def queued(self, position: int) -> bytes:
+        return b'{"type":"queued","position":%d' % position + self._tail
+
+    def done(self) -> bytes:
+        return b'{"type":"done","duration_ms":%d' % self._elapsed_ms() + self._tail
+
+    def translate(self, event, emit):
+        """Pass the SSE payloads for one worker event to `emit`"""
+        if isinstance(event, str):
+            # Not JSON, forward as raw text
+            emit(self.message(event))
+            return
+        if not self.session_id and event.get('session_id'):
+            self.session_id = event['session_id']
+        handler = self._handlers.get(event.get('type'))
+        if handler is None:
+            # Forward other events as-is for debugging
+            event['session_id'] = self.session_id
+            emit(json_bytes(event))
+        else:
+            handler(self, event, emit)
+
+    def _assistant(self, event, emit):
+        for block in event.get('message', {}).get('content', []):
+            block_type = block.get('type')
+            if block_type == 'text':
+                emit(self.message(block.get('text', '')))
+            elif block_type == 'tool_use':
+                emit(b'{"type":"tool_use","tool":' + json_bytes(block.get('name', 'unknown')) + self._tail)
+
+    def _result(self, event, emit):
+        self.completed = True
+        emit(
+            b'{"type":"result","result":' + json_bytes(event.get('result', ''))
+            + b',"cost_usd":' + json_bytes(event.get('total_cost_usd', 0))
+            + b',"duration_ms":%d' % self._elapsed_ms()
+            + b',"session_id":' + json_bytes(event.get('session_id', self.session_id)) + b'}'
         )
 
-    # Check file size by reading content
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"File too large. Max size: {MAX_FILE_SIZE // (1024*1024)}MB")
+    def _error(self, event, emit):
+        emit(self.error(event.get('error', {}).get('message', 'Unknown error')))
 
-    # Generate unique filename
-    unique_id = str(uuid.uuid4())[:8]
-    safe_filename = f"{unique_id}_{file.filename.replace(' ', '_')}"
-    file_path = os.path.join(upload_dir, safe_filename)
-
-    # Save file
-    try:
-        with open(file_path, 'wb') as f:
-            f.write(content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    def _system(self, event, emit):
+        # System messages (e.g., "Thinking...")
+        if event.get('message'):
+            emit(b'{"type":"system","message":' + json_bytes(event['message']) + self._tail)
 
-    return {
-        "success": True,
-        "filename": safe_filename,
-        "path": file_path,
-        "size": len(content),
-        "agent": agent
+    _handlers = {
+        'assistant': _assistant,
+        'result': _result,
+        'error': _error,
+        'system': _system,
     }
 
 
-@app.get("/api/uploads/{agent}")
-async def list_uploads(agent: str):
-    """List uploaded files for an agent"""
-    if agent not in UPLOAD_DIRS:
-        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}")
+class AgentRuntime:
+    """A registered agent: its launch config plus how it executes a request"""
 
-    upload_dir = UPLOAD_DIRS[agent]
-    files = []
-
-    if os.path.exists(upload_dir):
-        for filename in os.listdir(upload_dir):
-            filepath = os.path.join(upload_dir, filename)
-            if os.path.isfile(filepath):
-                stat = os.stat(filepath)
-                files.append({
-                    "name": filename,
-                    "path": filepath,
-                    "size": stat.st_size,
-                    "modified": stat.st_mtime
-                })
-        files.sort(key=lambda x: x["modified"], reverse=True)
+    def __init__(self, config: AgentConfig):
+        self.config = config
 
-    return {"files": files, "agent": agent}
+    @property
+    def name(self) -> str:
+        return self.config.name
 
+    def env(self) -> dict:
+        return {**agent_env(), **self.config.env}
 
-@app.delete("/api/uploads/{agent}/{filename}")
-async def delete_upload(agent: str, filename: str):
-    """Delete an uploaded file"""
-    if agent not in UPLOAD_DIRS:
-        raise HTTPException(status_code=400, detail=f"Unknown agent: {agent}")
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """A scheduler slot under this agent's concurrency cap"""
+        return agent_scheduler.slot(self.name, self.config.max_concurrent, priority, **kwargs)
 
-    upload_dir = UPLOAD_DIRS[agent]
-    file_path = os.path.join(upload_dir, filename)
+    async def start(self):
+        pass
 
-    # Security check - ensure we're not deleting outside uploads dir
-    real_path = os.path.realpath(file_path)
-    if not real_path.startswith(os.path.realpath(upload_dir)):
-        raise HTTPException(status_code=403, detail="Access denied")
+    async def stop(self):
+        pass
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
 
-    try:
-        os.remove(file_path)
-        return {"success": True, "deleted": filename}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete: {str(e)}")
+class ClaudeRuntime(AgentRuntime):
+    """A Claude Code-backed agent served from a warm worker pool"""
 
+    def __init__(self, config: AgentConfig):
+        super().__init__(config)
+        self.pool = ClaudeWorkerPool(config.binary, config.cwd, config.pool_size, self.env())
 
-@app.post("/api/claude/chat/stream")
-async def claude_chat_stream(request: ClaudeCodeRequest):
-    """Stream response from Claude Code using SSE.
+    async def start(self):
+        self.pool.start()
 
-    Returns Server-Sent Events with the following event types:
-    - init: Initial event with basic info
-    - message: Claude's streaming text output
-    - tool_use: When Claude uses a tool
-    - result: Final result with session_id and cost
-    - error: If an error occurs
-    - done: Stream complete
-    """
-    async def generate():
-        import time
-        start_time = time.time()
-        session_id = request.session_id
-        accumulated_text = []
+    async def stop(self):
+        await self.pool.stop()
 
+    async def execute(self, run: AgentRun, request: ClaudeCodeRequest):
+        """Run one turn, writing its SSE payloads to the run's log"""
+        translator = StreamJsonTranslator(request.session_id)
+        emit = run.log.append
+        worker = None
+        timed_out = False
+        failed = False
+
+        def expire():
+            nonlocal timed_out
+            timed_out = True
+            run.cancel()
+
+        timer = None
         try:
-            cmd = [
-                CLAUDE_PATH,
-                "-p", request.message,
-                "--output-format", "stream-json",
-                "--verbose",  # Required when using stream-json with --print
-                "--dangerously-skip-permissions"  # YOLO mode - no approval needed
+            emit(translator.init(f"Starting {self.config.label}...", run.run_id))
+            on_queued = lambda position: emit(translator.queued(position))
+            async with self.slot(PRIORITY_INTERACTIVE, owner=run, on_queued=on_queued):
+                timer = asyncio.get_running_loop().call_later(self.config.timeout, expire)
+                worker = await self.pool.acquire(request.session_id, request.allowed_tools or self.config.allowed_tools)
+                run.attach(worker)
+
+                async for event in worker.turn(request.message):
+                    run.mark_first_output()
+                    translator.translate(event, emit)
+                    run.session_id = translator.session_id
+
+            if timed_out:
+                failed = True
+                emit(translator.error(f"{self.config.label} timed out after {self.config.timeout}s"))
+            elif run.cancelled:
+                emit(translator.cancelled())
+            elif not translator.completed:
+                # The process exited before finishing the turn
+                failed = True
+                error_text = "\n".join(worker.stderr_tail) or f"{self.config.label} exited unexpectedly"
+                emit(translator.error(error_text))
+            emit(translator.done())
+
+        except Exception as e:
+            failed = not run.cancelled
+            emit(translator.cancelled() if run.cancelled else translator.error(str(e)))
+        finally:
+            if timer is not None:
+                timer.cancel()
+            # A worker interrupted mid-turn can't be reused for the next message
+            if worker is not None:
+                self.pool.release(worker, reusable=translator.completed and not run.cancelled)
+            run.finish(failed)
+
+
+class GooseRuntime(AgentRuntime):
+    """Goose runs one process per request rather than a persistent worker"""
+
+    def command(self, request: GooseChatRequest) -> List[str]:
+        if request.mode == "research":
+            # Use the research recipe for full research with saving
+            return [
+                self.config.binary, "run",
+                "--recipe", os.path.join(self.config.cwd, "research-agent.yaml"),
+                "--params", f"topic={request.message}"
             ]
+        # Quick chat mode - just run with text
+        return [self.config.binary, "run", "--text", request.message]
 
-            if request.session_id:
-                cmd.extend(["--resume", request.session_id])
+    def timeout(self, request: GooseChatRequest) -> int:
+        # Research gets the full limit, quick chat a few minutes
+        return self.config.timeout if request.mode == "research" else 180
 
-            if request.allowed_tools:
-                cmd.extend(["--allowedTools", ",".join(request.allowed_tools)])
+    def priority(self, request: GooseChatRequest) -> int:
+        return PRIORITY_RESEARCH if request.mode == "research" else PRIORITY_INTERACTIVE
 
-            # Send init event
-            yield f"data: {json.dumps({'type': 'init', 'message': 'Starting Claude Code...'})}\n\n"
+    async def run_once(self, request: GooseChatRequest) -> subprocess.CompletedProcess:
+        """Run to completion and return the captured output"""
+        async with self.slot(self.priority(request)):
+            return await run_command(self.command(request), timeout=self.timeout(request),
+                                     env=self.env(), cwd=self.config.cwd, limited=False)
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=SPARKY_WORKING_DIR,  # Run in agent-sparky directory for Sparky context
-                env={**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
-            )
+    async def execute(self, run: AgentRun, request: GooseChatRequest):
+        """Run one request, writing output lines, sources and the saved file to the run's log as they appear"""
+        start_time = time.time()
+        emit = lambda payload: run.log.append(json_bytes(payload))
+        scanner = GooseOutputScanner()
+        stderr_tail = deque(maxlen=20)
+        timeout = self.timeout(request)
+        timed_out = False
+        failed = False
+
+        def expire():
+            nonlocal timed_out
+            timed_out = True
+            run.cancel()
+
+        async def read_stdout(stream):
+            async for raw in stream:
+                run.mark_first_output()
+                line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                emit({"type": "output", "line": line})
+                sources, saved_file = scanner.feed(line)
+                for url in sources:
+                    emit({"type": "source", "url": url})
+                if saved_file:
+                    emit({"type": "saved", "file": saved_file})
+
+        async def read_stderr(stream):
+            async for raw in stream:
+                stderr_tail.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+
+        timer = None
+        try:
+            emit({"type": "init", "message": f"Starting {self.config.label}...", "run_id": run.run_id})
+            on_queued = lambda position: emit({"type": "queued", "position": position})
+            async with self.slot(self.priority(request), owner=run, on_queued=on_queued):
+                timer = asyncio.get_running_loop().call_later(timeout, expire)
+                process = await spawn_process(
+                    self.command(request), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    cwd=self.config.cwd, env=self.env(), start_new_session=True, limit=AGENT_STREAM_LIMIT
+                )
+                run.attach(AgentProcess(process))
+                await asyncio.gather(read_stdout(process.stdout), read_stderr(process.stderr), process.wait())
+
+            if timed_out:
+                failed = True
+                emit({"type": "error", "error": f"{self.config.label} timed out after {timeout}s"})
+            elif run.cancelled:
+                emit({"type": "cancelled"})
+            elif process.returncode != 0:
+                failed = True
+                emit({"type": "error", "error": "\n".join(stderr_tail) or "Unknown error"})
+            else:
+                emit({
+                    "type": "result",
+                    "sources": scanner.sources,
+                    "saved_file": scanner.saved_file,
+                    "duration_ms": int((time.time() - start_time) * 1000),
+                })
+            emit({"type": "done", "duration_ms": int((time.time() - start_time) * 1000)})
 
-            # Read stdout line by line
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
+        except Exception as e:
+            failed = not run.cancelled
+            emit({"type": "cancelled"} if run.cancelled else {"type": "error", "error": str(e)})
+        finally:
+            if timer is not None:
+                timer.cancel()
+            run.finish(failed)
+
+
+class AgentProcess:
+    """A bare agent process, with the terminate() AgentRun.cancel expects of a worker"""
+
+    def __init__(self, process):
+        self.process = process
+
+    async def terminate(self):
+        await terminate_process_group(self.process)
+
+
+# Match URLs but exclude trailing punctuation like ), ], etc.
+GOOSE_URL_RE = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+')
+GOOSE_SAVED_RE = re.compile(r'(?:Saved to|saved to|Saving to):\s*([^\s\n]+\.md)')
+GOOSE_MAX_SOURCES = 10
 
-                line_text = line.decode('utf-8').strip()
-                if not line_text:
+
+class GooseOutputScanner:
+    """Picks sources and the saved research file out of Goose output one line at a time"""
+
+    def __init__(self):
+        self.sources = []
+        self.saved_file = None
+        self._seen = set()
+
+    def feed(self, line: str) -> tuple:
+        """Scan one line; returns (new source URLs, saved file path if this line names one)"""
+        new_sources = []
+        if len(self.sources) < GOOSE_MAX_SOURCES and "http" in line:
+            for url in GOOSE_URL_RE.findall(line):
+                # Remove trailing punctuation that's often not part of the URL
+                url = url.rstrip('.,;:!?)>\'"')
+                if len(url) <= 10 or url in self._seen:  # Basic sanity check
                     continue
+                self._seen.add(url)
+                self.sources.append(url)
+                new_sources.append(url)
+                if len(self.sources) >= GOOSE_MAX_SOURCES:
+                    break
+        saved_file = None
+        match = GOOSE_SAVED_RE.search(line)
+        if match:
+            saved_file = self.saved_file = match.group(1)
+        return new_sources, saved_file
 
-                try:
-                    # Parse the stream-json event
-                    event = json.loads(line_text)
-                    event_type = event.get('type', 'unknown')
-
-                    # Extract session_id from any event that has it
-                    if 'session_id' in event and not session_id:
-                        session_id = event['session_id']
-
-                    # Handle different event types from Claude Code stream-json
-                    if event_type == 'assistant':
-                        # Assistant message with content
-                        message = event.get('message', {})
-                        content = message.get('content', [])
-                        for block in content:
-                            if block.get('type') == 'text':
-                                text = block.get('text', '')
-                                accumulated_text.append(text)
-                                yield f"data: {json.dumps({'type': 'message', 'text': text, 'session_id': session_id})}\n\n"
-                            elif block.get('type') == 'tool_use':
-                                tool_name = block.get('name', 'unknown')
-                                yield f"data: {json.dumps({'type': 'tool_use', 'tool': tool_name, 'session_id': session_id})}\n\n"
-
-                    elif event_type == 'result':
-                        # Final result event
-                        result_text = event.get('result', '')
-                        cost = event.get('total_cost_usd', 0)
-                        duration_ms = int((time.time() - start_time) * 1000)
-                        final_session_id = event.get('session_id', session_id)
-
-                        yield f"data: {json.dumps({'type': 'result', 'result': result_text, 'session_id': final_session_id, 'cost_usd': cost, 'duration_ms': duration_ms})}\n\n"
-
-                    elif event_type == 'error':
-                        error_msg = event.get('error', {}).get('message', 'Unknown error')
-                        yield f"data: {json.dumps({'type': 'error', 'error': error_msg, 'session_id': session_id})}\n\n"
-
-                    elif event_type == 'system':
-                        # System messages (e.g., "Thinking...")
-                        system_msg = event.get('message', '')
-                        if system_msg:
-                            yield f"data: {json.dumps({'type': 'system', 'message': system_msg, 'session_id': session_id})}\n\n"
 
-                    else:
-                        # Forward other events as-is for debugging
-                        event['session_id'] = session_id
-                        yield f"data: {json.dumps(event)}\n\n"
+agent_runtimes = {}  # name -> AgentRuntime
 
-                except json.JSONDecodeError:
-                    # Not JSON, forward as raw text
-                    accumulated_text.append(line_text)
-                    yield f"data: {json.dumps({'type': 'message', 'text': line_text, 'session_id': session_id})}\n\n"
 
-            # Wait for process to complete
-            await process.wait()
+def register_agent_runtime(runtime: AgentRuntime) -> AgentRuntime:
+    agent_runtimes[runtime.name] = runtime
+    return runtime
 
-            # Check for errors in stderr
-            stderr_data = await process.stderr.read()
-            if process.returncode != 0 and stderr_data:
-                error_text = stderr_data.decode('utf-8').strip()
-                yield f"data: {json.dumps({'type': 'error', 'error': error_text, 'session_id': session_id})}\n\n"
 
-            # Send final done event
-            duration_ms = int((time.time() - start_time) * 1000)
-            yield f"data: {json.dumps({'type': 'done', 'session_id': session_id, 'duration_ms': duration_ms})}\n\n"
+register_agent_runtime(ClaudeRuntime(AgentConfig(
+    name="sparky", label="Claude Code", binary=CLAUDE_PATH, cwd=SPARKY_WORKING_DIR)))
+register_agent_runtime(ClaudeRuntime(AgentConfig(
+    name="rick", label="Rick", binary=RICK_PATH, cwd=RICK_WORKING_DIR)))
+register_agent_runtime(GooseRuntime(AgentConfig(
+    name="goose", label="Goose", binary=GOOSE_PATH, cwd=GOOSE_RESEARCH_DIR, timeout=600, max_concurrent=1,
+    # Use env var or default to host.docker.internal for container
+    env={"OLLAMA_HOST": os.environ.get("OLLAMA_HOST", "http://host.docker.internal:11434")})))
 
-        except asyncio.CancelledError:
-            # Client disconnected
-            yield f"data: {json.dumps({'type': 'cancelled', 'session_id': session_id})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e), 'session_id': session_id})}\n\n"
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # Disable nginx buffering
-        }
-    )
+@app.on_event("startup")
+async def start_agent_runtimes():
+    for runtime in agent_runtimes.values():
+        await runtime.start()
+
+
+@app.on_event("shutdown")
+async def stop_agent_runtimes():
+    await asyncio.gather(*(runtime.stop() for runtime in agent_runtimes.values()))
+
+
+@app.post("/api/claude/chat/stream")
+async def claude_chat_stream(request: ClaudeCodeRequest):
+    """Stream response from Claude Code using SSE.
+
+    Returns Server-Sent Events with the following event types:
+    - init: Initial event with basic info and the run_id
+    - message: Claude's streaming text output
+    - tool_use: When Claude uses a tool
+    - result: Final result with session_id and cost
+    - error: If an error occurs
+    - cancelled: The run was cancelled via /api/agents/runs/{run_id}/cancel
+    - done: Stream complete
+
+    A client that disconnects can resume with /api/agents/runs/{run_id}/events.
+    """
+    run = start_agent_run("sparky", request, agent_runtimes["sparky"].execute)
+    return run_stream_response(run)
 
 
 # ============ Goose Research Agent Integration ============
@@ -1033,10 +4829,7 @@ async def claude_chat_stream(request: ClaudeCodeRequest):
 async def goose_status():
     """Check if Goose is available"""
     try:
-        result = subprocess.run(
-            [GOOSE_PATH, "--version"],
-            capture_output=True, text=True, timeout=5
-        )
+        result = await run_command([GOOSE_PATH, "--version"], timeout=5)
         if result.returncode == 0:
             return {
                 "available": True,
@@ -1053,43 +4846,10 @@ async def goose_status():
 @app.post("/api/goose/chat")
 async def goose_chat(request: GooseChatRequest):
     """Send a message to Goose research agent"""
-    import time
     start_time = time.time()
 
     try:
-        # Build command based on mode
-        if request.mode == "research":
-            # Use the research recipe for full research with saving
-            cmd = [
-                GOOSE_PATH, "run",
-                "--recipe", os.path.join(GOOSE_RESEARCH_DIR, "research-agent.yaml"),
-                "--params", f"topic={request.message}"
-            ]
-        else:
-            # Quick chat mode - just run with text
-            cmd = [
-                GOOSE_PATH, "run",
-                "--text", request.message
-            ]
-
-        # Set environment for Ollama (use env var or default to host.docker.internal for container)
-        ollama_host = os.environ.get("OLLAMA_HOST", "http://host.docker.internal:11434")
-        env = {
-            **os.environ,
-            "OLLAMA_HOST": ollama_host,
-            "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"
-        }
-
-        # Run Goose with timeout (10 minutes for research, 3 minutes for chat)
-        timeout = 600 if request.mode == "research" else 180
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            env=env,
-            cwd=GOOSE_RESEARCH_DIR
-        )
+        result = await agent_runtimes["goose"].run_once(request)
 
         duration_ms = int((time.time() - start_time) * 1000)
 
@@ -1104,32 +4864,15 @@ async def goose_chat(request: GooseChatRequest):
 
         # Parse output to extract sources if present
         output = result.stdout
-        sources = []
-        saved_file = None
-
-        # Try to extract URLs from output
-        import re
-        # Match URLs but exclude trailing punctuation like ), ], etc.
-        raw_urls = re.findall(r'https?://[^\s<>"{}|\\^`\[\]]+', output)
-        # Clean up URLs by removing trailing punctuation
-        cleaned_urls = []
-        for url in raw_urls:
-            # Remove trailing punctuation that's often not part of the URL
-            url = url.rstrip('.,;:!?)>\'"')
-            if url and len(url) > 10:  # Basic sanity check
-                cleaned_urls.append(url)
-        sources = list(set(cleaned_urls))[:10]  # Dedupe and limit to 10
-
-        # Check if a file was saved (look for "Saved to:" pattern)
-        saved_match = re.search(r'(?:Saved to|saved to|Saving to):\s*([^\s\n]+\.md)', output)
-        if saved_match:
-            saved_file = saved_match.group(1)
+        scanner = GooseOutputScanner()
+        for line in output.splitlines():
+            scanner.feed(line)
 
         return {
             "result": output,
             "duration_ms": duration_ms,
-            "sources": sources,
-            "saved_file": saved_file,
+            "sources": scanner.sources,
+            "saved_file": scanner.saved_file,
             "is_error": False
         }
 
@@ -1141,30 +4884,72 @@ async def goose_chat(request: GooseChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/goose/chat/stream")
+async def goose_chat_stream(request: GooseChatRequest):
+    """Run Goose in the background, streaming output lines, sources and the saved file over SSE.
+
+    The run outlives this connection; reattach with /api/agents/runs/{run_id}/events.
+    """
+    run = start_agent_run("goose", request, agent_runtimes["goose"].execute)
+    return run_stream_response(run)
+
+
 @app.get("/api/goose/research")
-async def list_research():
+async def list_research(sort: str = "modified", order: str = "desc", prefix: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=1, le=PAGE_LIMIT_MAX), offset: int = Query(0, ge=0)):
     """List all saved research files"""
     try:
-        files = []
-        if os.path.exists(GOOSE_DATA_DIR):
-            for filename in os.listdir(GOOSE_DATA_DIR):
-                if filename.endswith('.md'):
-                    filepath = os.path.join(GOOSE_DATA_DIR, filename)
-                    stat = os.stat(filepath)
-                    files.append({
-                        "name": filename,
-                        "size": stat.st_size,
-                        "modified": stat.st_mtime,
-                    })
-            # Sort by modified time, newest first
-            files.sort(key=lambda x: x["modified"], reverse=True)
-            # Convert mtime to ISO format
-            from datetime import datetime
-            for f in files:
-                f["modified"] = datetime.fromtimestamp(f["modified"]).isoformat()
-        return {"files": files}
+        page = await asyncio.to_thread(research_catalog.list, sort, order != "asc", prefix, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    from datetime import datetime
+    files = [
+        {
+            "name": f["name"],
+            "size": f["size"],
+            "modified": datetime.fromtimestamp(f["mtime"]).isoformat(),
+            "sha256": f["sha256"],
+        }
+        for f in page["files"]
+    ]
+    return {"files": files, "total": page["total"]}
+
+
+@app.get("/api/goose/research/search")
+async def search_research(q: str, limit: int = 20, offset: int = 0):
+    """Full-text search over saved research, best matches first.
+
+    `title` and `snippet` are HTML-escaped with matched terms wrapped in <mark>.
+    """
+    limit = max(1, min(limit, 100))
+    try:
+        page = await asyncio.to_thread(research_catalog.search, q, limit, max(offset, 0))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    from datetime import datetime
+    results = [
+        {
+            "name": r["name"],
+            "size": r["size"],
+            "modified": datetime.fromtimestamp(r["mtime"]).isoformat(),
+            "title": r["title"],
+            "snippet": r["snippet"],
+            "rank": r["rank"],
+        }
+        for r in page["results"]
+    ]
+    return {"results": results, "total": page["total"], "limit": limit, "offset": offset}
+
+
+@app.api_route("/api/goose/research/{filename}/raw", methods=["GET", "HEAD"])
+async def get_research_raw(filename: str, request: Request, download: bool = False):
+    """Serve a research file as markdown, with Range, ETag/304 and compressed variants"""
+    path = resolve_served_file(GOOSE_DATA_DIR, filename)
+    return await serve_file(request, path, media_type="text/markdown; charset=utf-8", download=download)
 
 
 @app.get("/api/goose/research/{filename}")
@@ -1203,6 +4988,7 @@ async def delete_research(filename: str):
             raise HTTPException(status_code=403, detail="Access denied")
 
         os.remove(filepath)
+        await asyncio.to_thread(research_catalog.forget, filename)
         return {"success": True, "deleted": filename}
     except HTTPException:
         raise
@@ -1212,31 +4998,11 @@ async def delete_research(filename: str):
 
 # ============ Rick Agent Integration (Family Assistant) ============
 
-def load_rick_sessions() -> dict:
-    """Load saved Rick sessions from JSON file"""
-    if os.path.exists(RICK_SESSIONS_FILE):
-        try:
-            with open(RICK_SESSIONS_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {"sessions": []}
-    return {"sessions": []}
-
-
-def save_rick_sessions(data: dict):
-    """Save Rick sessions to JSON file"""
-    with open(RICK_SESSIONS_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-
-
 @app.get("/api/rick/status")
 async def rick_status():
     """Check if Rick agent is available"""
     try:
-        result = subprocess.run(
-            [RICK_PATH, "--version"],
-            capture_output=True, text=True, timeout=5
-        )
+        result = await run_command([RICK_PATH, "--version"], timeout=5)
         if result.returncode == 0:
             return {
                 "available": True,
@@ -1252,56 +5018,22 @@ async def rick_status():
 
 
 @app.get("/api/rick/sessions")
-async def list_rick_sessions():
-    """List all saved Rick sessions"""
-    data = load_rick_sessions()
-    return {"sessions": data.get("sessions", [])}
+async def list_rick_sessions(limit: Optional[int] = Query(None, ge=1, le=PAGE_LIMIT_MAX),
+                             cursor: Optional[str] = None):
+    """List saved Rick sessions, most recently updated first"""
+    return await list_agent_sessions("rick", limit, cursor)
 
 
 @app.post("/api/rick/sessions")
 async def save_rick_session(request: SaveSessionRequest):
     """Save or update a Rick session"""
-    from datetime import datetime
-
-    data = load_rick_sessions()
-    sessions = data.get("sessions", [])
-
-    existing = next((s for s in sessions if s["session_id"] == request.session_id), None)
-
-    if existing:
-        existing["name"] = request.name
-        existing["updated_at"] = datetime.now().isoformat()
-        if request.first_message:
-            existing["first_message"] = request.first_message
-    else:
-        sessions.append({
-            "session_id": request.session_id,
-            "name": request.name,
-            "first_message": request.first_message or "",
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        })
-
-    data["sessions"] = sessions
-    save_rick_sessions(data)
-    return {"success": True, "session_id": request.session_id}
+    return await save_agent_session("rick", request)
 
 
 @app.delete("/api/rick/sessions/{session_id}")
 async def delete_rick_session(session_id: str):
     """Delete a saved Rick session"""
-    data = load_rick_sessions()
-    sessions = data.get("sessions", [])
-
-    original_count = len(sessions)
-    sessions = [s for s in sessions if s["session_id"] != session_id]
-
-    if len(sessions) == original_count:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    data["sessions"] = sessions
-    save_rick_sessions(data)
-    return {"success": True, "deleted": session_id}
+    return await delete_agent_session("rick", session_id)
 
 
 @app.post("/api/rick/chat/stream")
@@ -1311,116 +5043,8 @@ async def rick_chat_stream(request: ClaudeCodeRequest):
     Rick runs Claude Code with the agent-rick working directory context,
     giving it access to family documents and personal information.
     """
-    async def generate():
-        import time
-        start_time = time.time()
-        session_id = request.session_id
-        accumulated_text = []
-
-        try:
-            cmd = [
-                RICK_PATH,
-                "-p", request.message,
-                "--output-format", "stream-json",
-                "--verbose",
-                "--dangerously-skip-permissions"
-            ]
-
-            if request.session_id:
-                cmd.extend(["--resume", request.session_id])
-
-            if request.allowed_tools:
-                cmd.extend(["--allowedTools", ",".join(request.allowed_tools)])
-
-            # Send init event
-            yield f"data: {json.dumps({'type': 'init', 'message': 'Starting Rick...'})}\n\n"
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=RICK_WORKING_DIR,  # Run in agent-rick directory for context
-                env={**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
-            )
-
-            # Read stdout line by line
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-
-                line_text = line.decode('utf-8').strip()
-                if not line_text:
-                    continue
-
-                try:
-                    event = json.loads(line_text)
-                    event_type = event.get('type', 'unknown')
-
-                    if 'session_id' in event and not session_id:
-                        session_id = event['session_id']
-
-                    if event_type == 'assistant':
-                        message = event.get('message', {})
-                        content = message.get('content', [])
-                        for block in content:
-                            if block.get('type') == 'text':
-                                text = block.get('text', '')
-                                accumulated_text.append(text)
-                                yield f"data: {json.dumps({'type': 'message', 'text': text, 'session_id': session_id})}\n\n"
-                            elif block.get('type') == 'tool_use':
-                                tool_name = block.get('name', 'unknown')
-                                yield f"data: {json.dumps({'type': 'tool_use', 'tool': tool_name, 'session_id': session_id})}\n\n"
-
-                    elif event_type == 'result':
-                        result_text = event.get('result', '')
-                        cost = event.get('total_cost_usd', 0)
-                        duration_ms = int((time.time() - start_time) * 1000)
-                        final_session_id = event.get('session_id', session_id)
-
-                        yield f"data: {json.dumps({'type': 'result', 'result': result_text, 'session_id': final_session_id, 'cost_usd': cost, 'duration_ms': duration_ms})}\n\n"
-
-                    elif event_type == 'error':
-                        error_msg = event.get('error', {}).get('message', 'Unknown error')
-                        yield f"data: {json.dumps({'type': 'error', 'error': error_msg, 'session_id': session_id})}\n\n"
-
-                    elif event_type == 'system':
-                        system_msg = event.get('message', '')
-                        if system_msg:
-                            yield f"data: {json.dumps({'type': 'system', 'message': system_msg, 'session_id': session_id})}\n\n"
-
-                    else:
-                        event['session_id'] = session_id
-                        yield f"data: {json.dumps(event)}\n\n"
-
-                except json.JSONDecodeError:
-                    accumulated_text.append(line_text)
-                    yield f"data: {json.dumps({'type': 'message', 'text': line_text, 'session_id': session_id})}\n\n"
-
-            await process.wait()
-
-            stderr_data = await process.stderr.read()
-            if process.returncode != 0 and stderr_data:
-                error_text = stderr_data.decode('utf-8').strip()
-                yield f"data: {json.dumps({'type': 'error', 'error': error_text, 'session_id': session_id})}\n\n"
-
-            duration_ms = int((time.time() - start_time) * 1000)
-            yield f"data: {json.dumps({'type': 'done', 'session_id': session_id, 'duration_ms': duration_ms})}\n\n"
-
-        except asyncio.CancelledError:
-            yield f"data: {json.dumps({'type': 'cancelled', 'session_id': session_id})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e), 'session_id': session_id})}\n\n"
-
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
-    )
+    run = start_agent_run("rick", request, agent_runtimes["rick"].execute)
+    return run_stream_response(run)
 
 
 class SessionNameRequest(BaseModel):
@@ -1442,18 +5066,17 @@ async def rick_name_session(request: SessionNameRequest):
             "--dangerously-skip-permissions"
         ]
 
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=RICK_WORKING_DIR,
-            env={**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
-        )
-
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=60)
+        async with agent_runtimes["rick"].slot(PRIORITY_BACKGROUND):
+            completed = await run_command(
+                cmd,
+                timeout=60,
+                cwd=RICK_WORKING_DIR,
+                env=agent_env(),
+                limited=False
+            )
 
-        if process.returncode == 0:
-            result = json.loads(stdout.decode('utf-8'))
+        if completed.returncode == 0:
+            result = json.loads(completed.stdout)
             name = result.get('result', '').strip()
             # Clean up the name - remove quotes, limit length
             name = name.strip('"\'').strip()[:50]
@@ -1466,7 +5089,7 @@ async def rick_name_session(request: SessionNameRequest):
             fallback += "..."
         return {"success": True, "name": fallback}
 
-    except asyncio.TimeoutError:
+    except subprocess.TimeoutExpired:
         # Timeout - use fallback
         fallback = request.first_message[:30].strip()
         return {"success": True, "name": fallback}
@@ -1487,18 +5110,17 @@ async def claude_name_session(request: SessionNameRequest):
             "--dangerously-skip-permissions"
         ]
 
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=SPARKY_WORKING_DIR,
-            env={**os.environ, "PATH": f"{os.path.expanduser('~/.local/bin')}:{os.environ.get('PATH', '')}"}
-        )
-
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=60)
+        async with agent_runtimes["sparky"].slot(PRIORITY_BACKGROUND):
+            completed = await run_command(
+                cmd,
+                timeout=60,
+                cwd=SPARKY_WORKING_DIR,
+                env=agent_env(),
+                limited=False
+            )
 
-        if process.returncode == 0:
-            result = json.loads(stdout.decode('utf-8'))
+        if completed.returncode == 0:
+            result = json.loads(completed.stdout)
             name = result.get('result', '').strip()
             name = name.strip('"\'').strip()[:50]
             if name:
@@ -1509,7 +5131,7 @@ async def claude_name_session(request: SessionNameRequest):
             fallback += "..."
         return {"success": True, "name": fallback}
 
-    except asyncio.TimeoutError:
+    except subprocess.TimeoutExpired:
         fallback = request.first_message[:30].strip()
         return {"success": True, "name": fallback}
     except Exception as e:
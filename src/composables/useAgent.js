@@ -1,5 +1,8 @@
 import { ref, nextTick, onUnmounted } from 'vue'
 
+// Reconnect attempts when a run's stream drops mid-turn
+const STREAM_MAX_RECONNECTS = 5
+
 export function useAgent(apiBaseUrl) {
   const agentMessages = ref([])
   const agentInput = ref('')
@@ -16,6 +19,7 @@ export function useAgent(apiBaseUrl) {
 
   // Streaming state
   const currentStreamController = ref(null)
+  const currentRunId = ref(null)
   const streamingText = ref('')
   const currentTool = ref(null)
   const lastFailedSessionId = ref(null)
@@ -129,7 +133,7 @@ export function useAgent(apiBaseUrl) {
         session_id: agentSessionId.value
       }
 
-      const res = await fetch(`${apiBaseUrl}/claude/chat/stream`, {
+      let res = await fetch(`${apiBaseUrl}/claude/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
@@ -141,108 +145,136 @@ export function useAgent(apiBaseUrl) {
         throw new Error(err.detail || 'Request failed')
       }
 
-      const reader = res.body.getReader()
-      const decoder = new TextDecoder()
-      let buffer = ''
       let receivedSessionId = agentSessionId.value
       let finalResult = null
+      let lastEventId = null
+      let reconnects = 0
 
       while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
-
-        buffer += decoder.decode(value, { stream: true })
+        try {
+          const reader = res.body.getReader()
+          const decoder = new TextDecoder()
+          let buffer = ''
 
-        // Process SSE events (lines starting with "data: ")
-        const lines = buffer.split('\n')
-        buffer = lines.pop() || '' // Keep incomplete line in buffer
+          while (true) {
+            const { done, value } = await reader.read()
+            if (done) break
 
-        for (const line of lines) {
-          if (!line.startsWith('data: ')) continue
+            buffer += decoder.decode(value, { stream: true })
 
-          const jsonStr = line.slice(6) // Remove "data: " prefix
-          if (!jsonStr.trim()) continue
+            // Process SSE events (lines starting with "data: ")
+            const lines = buffer.split('\n')
+            buffer = lines.pop() || '' // Keep incomplete line in buffer
 
-          try {
-            const event = JSON.parse(jsonStr)
+            for (const line of lines) {
+              if (line.startsWith('id: ')) {
+                lastEventId = line.slice(4)
+                continue
+              }
+              if (!line.startsWith('data: ')) continue
 
-            // Track session ID as soon as we get it
-            if (event.session_id && !receivedSessionId) {
-              receivedSessionId = event.session_id
-              agentSessionId.value = event.session_id
-            }
+              const jsonStr = line.slice(6) // Remove "data: " prefix
+              if (!jsonStr.trim()) continue
 
-            switch (event.type) {
-              case 'init':
-                // Initial event
-                assistantMsg.content = '⏳ ' + (event.message || 'Starting...')
-                break
-
-              case 'message':
-                // Streaming text content
-                streamingText.value += event.text || ''
-                assistantMsg.content = streamingText.value
-                assistantMsg.loading = false
-                await scrollAgentToBottom()
-                break
-
-              case 'tool_use':
-                // Claude is using a tool
-                currentTool.value = event.tool
-                if (!assistantMsg.tools.includes(event.tool)) {
-                  assistantMsg.tools.push(event.tool)
-                }
-                // Show tool indicator in content
-                if (!streamingText.value.includes(`[Using ${event.tool}]`)) {
-                  streamingText.value += `\n[Using ${event.tool}...]\n`
-                  assistantMsg.content = streamingText.value
-                }
-                break
+              try {
+                const event = JSON.parse(jsonStr)
 
-              case 'system':
-                // System messages
-                if (event.message && !streamingText.value) {
-                  assistantMsg.content = '💭 ' + event.message
-                }
-                break
-
-              case 'result':
-                // Final result
-                finalResult = event
-                assistantMsg.content = event.result || streamingText.value
-                assistantMsg.duration = event.duration_ms
-                assistantMsg.cost = event.cost_usd
-                agentTotalCost.value += event.cost_usd || 0
-                if (event.session_id) {
+                // Track session ID as soon as we get it
+                if (event.session_id && !receivedSessionId) {
+                  receivedSessionId = event.session_id
                   agentSessionId.value = event.session_id
                 }
-                break
-
-              case 'error':
-                // Error occurred
-                assistantMsg.content = `Error: ${event.error}`
-                assistantMsg.isError = true
-                // Save session ID for potential resume
-                if (event.session_id) {
-                  lastFailedSessionId.value = event.session_id
-                }
-                break
 
-              case 'done':
-                // Stream complete
-                assistantMsg.duration = assistantMsg.duration || event.duration_ms
-                if (event.session_id) {
-                  agentSessionId.value = event.session_id
+                switch (event.type) {
+                  case 'init':
+                    // Initial event
+                    currentRunId.value = event.run_id || null
+                    assistantMsg.content = '⏳ ' + (event.message || 'Starting...')
+                    break
+
+                  case 'queued':
+                    // Waiting for the agent scheduler to admit the run
+                    assistantMsg.content = `⏳ Queued (position ${event.position})...`
+                    break
+
+                  case 'message':
+                    // Streaming text content
+                    streamingText.value += event.text || ''
+                    assistantMsg.content = streamingText.value
+                    assistantMsg.loading = false
+                    await scrollAgentToBottom()
+                    break
+
+                  case 'tool_use':
+                    // Claude is using a tool
+                    currentTool.value = event.tool
+                    if (!assistantMsg.tools.includes(event.tool)) {
+                      assistantMsg.tools.push(event.tool)
+                    }
+                    // Show tool indicator in content
+                    if (!streamingText.value.includes(`[Using ${event.tool}]`)) {
+                      streamingText.value += `\n[Using ${event.tool}...]\n`
+                      assistantMsg.content = streamingText.value
+                    }
+                    break
+
+                  case 'system':
+                    // System messages
+                    if (event.message && !streamingText.value) {
+                      assistantMsg.content = '💭 ' + event.message
+                    }
+                    break
+
+                  case 'result':
+                    // Final result
+                    finalResult = event
+                    assistantMsg.content = event.result || streamingText.value
+                    assistantMsg.duration = event.duration_ms
+                    assistantMsg.cost = event.cost_usd
+                    agentTotalCost.value += event.cost_usd || 0
+                    if (event.session_id) {
+                      agentSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'error':
+                    // Error occurred
+                    assistantMsg.content = `Error: ${event.error}`
+                    assistantMsg.isError = true
+                    // Save session ID for potential resume
+                    if (event.session_id) {
+                      lastFailedSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'done':
+                    // Stream complete
+                    assistantMsg.duration = assistantMsg.duration || event.duration_ms
+                    if (event.session_id) {
+                      agentSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'cancelled':
+                    assistantMsg.content += '\n\n[Cancelled]'
+                    break
                 }
-                break
-
-              case 'cancelled':
-                assistantMsg.content += '\n\n[Cancelled]'
-                break
+              } catch (parseErr) {
+                console.warn('Failed to parse SSE event:', jsonStr, parseErr)
+              }
             }
-          } catch (parseErr) {
-            console.warn('Failed to parse SSE event:', jsonStr, parseErr)
           }
+          break
+        } catch (streamErr) {
+          // The run keeps going on the server when the connection drops, so resume it
+          if (streamErr.name === 'AbortError' || !currentRunId.value || reconnects >= STREAM_MAX_RECONNECTS) throw streamErr
+          reconnects++
+          await new Promise(resolve => setTimeout(resolve, 1000 * reconnects))
+          res = await fetch(`${apiBaseUrl}/agents/runs/${currentRunId.value}/events`, {
+            headers: lastEventId !== null ? { 'Last-Event-ID': lastEventId } : {},
+            signal: abortController.signal
+          })
+          if (!res.ok) throw streamErr
         }
       }
 
@@ -305,6 +337,7 @@ export function useAgent(apiBaseUrl) {
     } finally {
       agentLoading.value = false
       currentStreamController.value = null
+      currentRunId.value = null
       streamingText.value = ''
       currentTool.value = null
     }
@@ -312,6 +345,10 @@ export function useAgent(apiBaseUrl) {
 
   // Cancel current streaming request
   function cancelAgentStream() {
+    // Dropping the connection only detaches from the run, so stop it server-side too
+    if (currentRunId.value) {
+      fetch(`${apiBaseUrl}/agents/runs/${currentRunId.value}/cancel`, { method: 'POST' }).catch(() => {})
+    }
     if (currentStreamController.value) {
       currentStreamController.value.abort()
     }
@@ -338,9 +375,7 @@ export function useAgent(apiBaseUrl) {
 
   function clearAgent() {
     // Cancel any ongoing stream
-    if (currentStreamController.value) {
-      currentStreamController.value.abort()
-    }
+    cancelAgentStream()
     agentMessages.value = []
     agentSessionId.value = null
     agentSessionName.value = ''
@@ -1,4 +1,5 @@
 import { ref } from 'vue'
+import { startJob, followJob, findRunningJob } from '../utils/jobs.js'
 
 export function useManagement(apiBaseUrl) {
   const managementServices = ref([])
@@ -10,6 +11,7 @@ export function useManagement(apiBaseUrl) {
   const actionLoading = ref({})
   const managementError = ref('')
   const logsModal = ref({ visible: false, container: '', content: '' })
+  let jobStream = null
 
   async function fetchManagementApi(endpoint, options = {}) {
     const res = await fetch(`${apiBaseUrl}${endpoint}`, {
@@ -27,13 +29,12 @@ export function useManagement(apiBaseUrl) {
     managementLoading.value = true
     managementError.value = ''
     try {
-      const [servicesData, containersData, trinityData] = await Promise.all([
-        fetchManagementApi('/services'),
-        fetchManagementApi('/containers?all=true'),
+      const [snapshot, trinityData] = await Promise.all([
+        fetchManagementApi('/snapshot?fields=services,containers'),
         fetchManagementApi('/trinity/status').catch(() => ({ services: [], version: null }))
       ])
-      managementServices.value = (servicesData.services || []).filter(s => !s.name.startsWith('trinity-'))
-      containers.value = containersData.containers || []
+      managementServices.value = (snapshot.services || []).filter(s => !s.name.startsWith('trinity-'))
+      containers.value = Array.isArray(snapshot.containers) ? snapshot.containers : []
       trinity.value = trinityData
     } catch (e) {
       managementError.value = e.message
@@ -42,17 +43,30 @@ export function useManagement(apiBaseUrl) {
     }
   }
 
+  // Trinity update/restart run as maintenance jobs; wait for the job's 'done' frame
+  async function followTrinityJob(job) {
+    if (jobStream) jobStream.close()
+    const { source, done } = followJob(job, apiBaseUrl)
+    jobStream = source
+    const frame = await done
+    jobStream = null
+    return frame
+  }
+
+  async function finishTrinityUpdate(done) {
+    trinityUpdateResult.value = { success: done.status === 'succeeded', error: done.error, version: done.result?.version }
+    if (done.status === 'succeeded') {
+      const trinityData = await fetchManagementApi('/trinity/status').catch(() => ({ services: [], version: null }))
+      trinity.value = trinityData
+    }
+  }
+
   async function updateTrinity() {
     if (trinityUpdating.value) return
     trinityUpdating.value = true
     trinityUpdateResult.value = null
     try {
-      const result = await fetchManagementApi('/trinity/update', { method: 'POST' })
-      trinityUpdateResult.value = result
-      if (result.success) {
-        const trinityData = await fetchManagementApi('/trinity/status').catch(() => ({ services: [], version: null }))
-        trinity.value = trinityData
-      }
+      await finishTrinityUpdate(await followTrinityJob(await startJob('trinity-update', apiBaseUrl)))
     } catch (e) {
       trinityUpdateResult.value = { success: false, error: e.message }
     } finally {
@@ -63,7 +77,8 @@ export function useManagement(apiBaseUrl) {
   async function restartTrinity() {
     actionLoading.value['trinity-restart'] = true
     try {
-      await fetchManagementApi('/trinity/restart', { method: 'POST' })
+      const done = await followTrinityJob(await startJob('trinity-restart', apiBaseUrl))
+      if (done.status !== 'succeeded') throw new Error(done.error)
       await loadManagement()
     } catch (e) {
       managementError.value = `Failed to restart Trinity: ${e.message}`
@@ -72,6 +87,34 @@ export function useManagement(apiBaseUrl) {
     }
   }
 
+  // Pick up a Trinity job that was started elsewhere (desktop UI or an earlier visit)
+  async function resumeTrinityJob() {
+    if (jobStream) return
+    const job = await findRunningJob('trinity-', apiBaseUrl)
+    if (!job) return
+    if (job.kind === 'trinity-update') {
+      trinityUpdating.value = true
+      try {
+        await finishTrinityUpdate(await followTrinityJob(job))
+      } finally {
+        trinityUpdating.value = false
+      }
+    } else {
+      actionLoading.value['trinity-restart'] = true
+      try {
+        await followTrinityJob(job)
+        await loadManagement()
+      } finally {
+        actionLoading.value['trinity-restart'] = false
+      }
+    }
+  }
+
+  function cleanupManagement() {
+    if (jobStream) jobStream.close()
+    jobStream = null
+  }
+
   async function performAction(containerName, action) {
     const key = `${containerName}-${action}`
     actionLoading.value[key] = true
@@ -157,6 +200,8 @@ export function useManagement(apiBaseUrl) {
     loadManagement,
     updateTrinity,
     restartTrinity,
+    resumeTrinityJob,
+    cleanupManagement,
     performAction,
     restartService,
     startService,
@@ -1,5 +1,8 @@
 import { ref, nextTick } from 'vue'
 
+// Reconnect attempts when a run's stream drops mid-turn
+const STREAM_MAX_RECONNECTS = 5
+
 export function useRick(apiBaseUrl) {
   const rickMessages = ref([])
   const rickInput = ref('')
@@ -16,6 +19,7 @@ export function useRick(apiBaseUrl) {
 
   // Streaming state
   const currentRickStreamController = ref(null)
+  const currentRickRunId = ref(null)
   const rickStreamingText = ref('')
   const rickCurrentTool = ref(null)
   const rickLastFailedSessionId = ref(null)
@@ -129,7 +133,7 @@ export function useRick(apiBaseUrl) {
         session_id: rickSessionId.value
       }
 
-      const res = await fetch(`${apiBaseUrl}/rick/chat/stream`, {
+      let res = await fetch(`${apiBaseUrl}/rick/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
@@ -141,99 +145,126 @@ export function useRick(apiBaseUrl) {
         throw new Error(err.detail || 'Request failed')
       }
 
-      const reader = res.body.getReader()
-      const decoder = new TextDecoder()
-      let buffer = ''
       let receivedSessionId = rickSessionId.value
       let finalResult = null
+      let lastEventId = null
+      let reconnects = 0
 
       while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
-
-        buffer += decoder.decode(value, { stream: true })
+        try {
+          const reader = res.body.getReader()
+          const decoder = new TextDecoder()
+          let buffer = ''
 
-        // Process SSE events (lines starting with "data: ")
-        const lines = buffer.split('\n')
-        buffer = lines.pop() || '' // Keep incomplete line in buffer
+          while (true) {
+            const { done, value } = await reader.read()
+            if (done) break
 
-        for (const line of lines) {
-          if (!line.startsWith('data: ')) continue
+            buffer += decoder.decode(value, { stream: true })
 
-          const jsonStr = line.slice(6) // Remove "data: " prefix
-          if (!jsonStr.trim()) continue
+            // Process SSE events (lines starting with "data: ")
+            const lines = buffer.split('\n')
+            buffer = lines.pop() || '' // Keep incomplete line in buffer
 
-          try {
-            const event = JSON.parse(jsonStr)
+            for (const line of lines) {
+              if (line.startsWith('id: ')) {
+                lastEventId = line.slice(4)
+                continue
+              }
+              if (!line.startsWith('data: ')) continue
 
-            // Track session ID as soon as we get it
-            if (event.session_id && !receivedSessionId) {
-              receivedSessionId = event.session_id
-              rickSessionId.value = event.session_id
-            }
+              const jsonStr = line.slice(6) // Remove "data: " prefix
+              if (!jsonStr.trim()) continue
 
-            switch (event.type) {
-              case 'init':
-                assistantMsg.content = '⏳ ' + (event.message || 'Starting...')
-                break
-
-              case 'message':
-                rickStreamingText.value += event.text || ''
-                assistantMsg.content = rickStreamingText.value
-                assistantMsg.loading = false
-                await scrollRickToBottom()
-                break
-
-              case 'tool_use':
-                rickCurrentTool.value = event.tool
-                if (!assistantMsg.tools.includes(event.tool)) {
-                  assistantMsg.tools.push(event.tool)
-                }
-                if (!rickStreamingText.value.includes(`[Using ${event.tool}]`)) {
-                  rickStreamingText.value += `\n[Using ${event.tool}...]\n`
-                  assistantMsg.content = rickStreamingText.value
-                }
-                break
+              try {
+                const event = JSON.parse(jsonStr)
 
-              case 'system':
-                if (event.message && !rickStreamingText.value) {
-                  assistantMsg.content = '💭 ' + event.message
-                }
-                break
-
-              case 'result':
-                finalResult = event
-                assistantMsg.content = event.result || rickStreamingText.value
-                assistantMsg.duration = event.duration_ms
-                assistantMsg.cost = event.cost_usd
-                rickTotalCost.value += event.cost_usd || 0
-                if (event.session_id) {
+                // Track session ID as soon as we get it
+                if (event.session_id && !receivedSessionId) {
+                  receivedSessionId = event.session_id
                   rickSessionId.value = event.session_id
                 }
-                break
-
-              case 'error':
-                assistantMsg.content = `Error: ${event.error}`
-                assistantMsg.isError = true
-                if (event.session_id) {
-                  rickLastFailedSessionId.value = event.session_id
-                }
-                break
 
-              case 'done':
-                assistantMsg.duration = assistantMsg.duration || event.duration_ms
-                if (event.session_id) {
-                  rickSessionId.value = event.session_id
+                switch (event.type) {
+                  case 'init':
+                    currentRickRunId.value = event.run_id || null
+                    assistantMsg.content = '⏳ ' + (event.message || 'Starting...')
+                    break
+
+                  case 'queued':
+                    assistantMsg.content = `⏳ Queued (position ${event.position})...`
+                    break
+
+                  case 'message':
+                    rickStreamingText.value += event.text || ''
+                    assistantMsg.content = rickStreamingText.value
+                    assistantMsg.loading = false
+                    await scrollRickToBottom()
+                    break
+
+                  case 'tool_use':
+                    rickCurrentTool.value = event.tool
+                    if (!assistantMsg.tools.includes(event.tool)) {
+                      assistantMsg.tools.push(event.tool)
+                    }
+                    if (!rickStreamingText.value.includes(`[Using ${event.tool}]`)) {
+                      rickStreamingText.value += `\n[Using ${event.tool}...]\n`
+                      assistantMsg.content = rickStreamingText.value
+                    }
+                    break
+
+                  case 'system':
+                    if (event.message && !rickStreamingText.value) {
+                      assistantMsg.content = '💭 ' + event.message
+                    }
+                    break
+
+                  case 'result':
+                    finalResult = event
+                    assistantMsg.content = event.result || rickStreamingText.value
+                    assistantMsg.duration = event.duration_ms
+                    assistantMsg.cost = event.cost_usd
+                    rickTotalCost.value += event.cost_usd || 0
+                    if (event.session_id) {
+                      rickSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'error':
+                    assistantMsg.content = `Error: ${event.error}`
+                    assistantMsg.isError = true
+                    if (event.session_id) {
+                      rickLastFailedSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'done':
+                    assistantMsg.duration = assistantMsg.duration || event.duration_ms
+                    if (event.session_id) {
+                      rickSessionId.value = event.session_id
+                    }
+                    break
+
+                  case 'cancelled':
+                    assistantMsg.content += '\n\n[Cancelled]'
+                    break
                 }
-                break
-
-              case 'cancelled':
-                assistantMsg.content += '\n\n[Cancelled]'
-                break
+              } catch (parseErr) {
+                console.warn('Failed to parse SSE event:', jsonStr, parseErr)
+              }
             }
-          } catch (parseErr) {
-            console.warn('Failed to parse SSE event:', jsonStr, parseErr)
           }
+          break
+        } catch (streamErr) {
+          // The run keeps going on the server when the connection drops, so resume it
+          if (streamErr.name === 'AbortError' || !currentRickRunId.value || reconnects >= STREAM_MAX_RECONNECTS) throw streamErr
+          reconnects++
+          await new Promise(resolve => setTimeout(resolve, 1000 * reconnects))
+          res = await fetch(`${apiBaseUrl}/agents/runs/${currentRickRunId.value}/events`, {
+            headers: lastEventId !== null ? { 'Last-Event-ID': lastEventId } : {},
+            signal: abortController.signal
+          })
+          if (!res.ok) throw streamErr
         }
       }
 
@@ -294,12 +325,17 @@ export function useRick(apiBaseUrl) {
     } finally {
       rickLoading.value = false
       currentRickStreamController.value = null
+      currentRickRunId.value = null
       rickStreamingText.value = ''
       rickCurrentTool.value = null
     }
   }
 
   function cancelRickStream() {
+    // Dropping the connection only detaches from the run, so stop it server-side too
+    if (currentRickRunId.value) {
+      fetch(`${apiBaseUrl}/agents/runs/${currentRickRunId.value}/cancel`, { method: 'POST' }).catch(() => {})
+    }
     if (currentRickStreamController.value) {
       currentRickStreamController.value.abort()
     }
@@ -323,9 +359,7 @@ export function useRick(apiBaseUrl) {
   }
 
   function clearRick() {
-    if (currentRickStreamController.value) {
-      currentRickStreamController.value.abort()
-    }
+    cancelRickStream()
     rickMessages.value = []
     rickSessionId.value = null
     rickSessionName.value = ''
@@ -26,6 +26,7 @@ export function useTelemetry() {
   let memChart = null
   let gpuChart = null
   let statsInterval = null
+  let processStream = null
 
   function initHistory() {
     const now = Date.now() / 1000
@@ -102,10 +103,9 @@ export function useTelemetry() {
 
   async function loadStats(apiBaseUrl) {
     try {
-      const [sysRes, ollamaRes, processRes] = await Promise.all([
+      const [sysRes, ollamaRes] = await Promise.all([
         fetch(`${TELEMETRY_URL}/stats`, { signal: AbortSignal.timeout(3000) }).catch(() => null),
-        fetch(`${OLLAMA_URL}/api/ps`, { signal: AbortSignal.timeout(3000) }).catch(() => null),
-        fetch(`${apiBaseUrl}/processes?limit=5`, { signal: AbortSignal.timeout(3000) }).catch(() => null)
+        fetch(`${OLLAMA_URL}/api/ps`, { signal: AbortSignal.timeout(3000) }).catch(() => null)
       ])
 
       if (sysRes?.ok) {
@@ -132,10 +132,6 @@ export function useTelemetry() {
         ollamaLoadedModels.value = data.models || []
       }
 
-      if (processRes?.ok) {
-        topProcesses.value = await processRes.json()
-      }
-
       statsLoading.value = false
 
       if (!cpuChart && cpuChartEl.value) {
@@ -147,9 +143,21 @@ export function useTelemetry() {
     }
   }
 
+  // Top processes are pushed by the backend sampler instead of polled
+  function openProcessStream(apiBaseUrl) {
+    processStream = new EventSource(`${apiBaseUrl}/telemetry/stream?fields=processes&process_limit=5`)
+    processStream.onmessage = (event) => {
+      const data = JSON.parse(event.data)
+      if (data.processes && !data.processes.error) {
+        topProcesses.value = data.processes
+      }
+    }
+  }
+
   function startPolling(apiBaseUrl) {
     initHistory()
     loadStats(apiBaseUrl)
+    openProcessStream(apiBaseUrl)
     statsInterval = setInterval(() => loadStats(apiBaseUrl), 5000)
   }
 
@@ -158,6 +166,10 @@ export function useTelemetry() {
       clearInterval(statsInterval)
       statsInterval = null
     }
+    if (processStream) {
+      processStream.close()
+      processStream = null
+    }
   }
 
   function cleanup() {
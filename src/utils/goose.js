@@ -0,0 +1,74 @@
+// Goose chat over SSE: output lines, sources and the saved file arrive while the run is in progress
+
+// Apply one stream event to an assistant message ({ content, sources, saved_file, ... })
+function applyGooseEvent(msg, event) {
+  switch (event.type) {
+    case 'queued':
+      msg.status = `Queued (position ${event.position})...`
+      break
+    case 'output':
+      msg.loading = false
+      msg.content = msg.content ? `${msg.content}\n${event.line}` : event.line
+      break
+    case 'source':
+      msg.sources.push(event.url)
+      break
+    case 'saved':
+      msg.saved_file = event.file
+      break
+    case 'result':
+      msg.duration = event.duration_ms
+      break
+    case 'error':
+      msg.content = `Error: ${event.error}`
+      msg.isError = true
+      break
+    case 'cancelled':
+      msg.content += msg.content ? '\n\n[Cancelled]' : '[Cancelled]'
+      break
+  }
+}
+
+// POST a Goose request and stream its events into `msg` until the run ends.
+// `onUpdate` runs after each event, e.g. to keep the chat scrolled to the bottom.
+export async function streamGooseChat(payload, msg, apiBaseUrl = '/api', onUpdate = null) {
+  const res = await fetch(`${apiBaseUrl}/goose/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload)
+  })
+
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}))
+    throw new Error(err.detail || 'Request failed')
+  }
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop() || '' // Keep incomplete line in buffer
+
+    for (const line of lines) {
+      if (!line.startsWith('data: ')) continue
+      let event
+      try {
+        event = JSON.parse(line.slice(6))
+      } catch (e) {
+        console.warn('Failed to parse SSE event:', line, e)
+        continue
+      }
+      applyGooseEvent(msg, event)
+      if (onUpdate) onUpdate(event)
+    }
+  }
+
+  msg.loading = false
+  return msg
+}
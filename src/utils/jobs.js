@@ -0,0 +1,40 @@
+// Maintenance jobs (/api/jobs): start one, then follow its SSE events until the final 'done' frame
+
+export async function startJob(kind, apiBaseUrl = '/api') {
+  const res = await fetch(`${apiBaseUrl}/jobs`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ kind })
+  })
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({ detail: res.statusText }))
+    throw new Error(err.detail || 'API error')
+  }
+  return res.json()
+}
+
+// Returns { source, done }: `done` resolves with the 'done' frame, `source` can be closed early.
+// `onFrame` sees every frame (step / output / done). EventSource reconnects on its own
+// and resumes from the last event id.
+export function followJob(job, apiBaseUrl = '/api', onFrame = null) {
+  const source = new EventSource(`${apiBaseUrl}/jobs/${job.job_id}/events`)
+  const done = new Promise((resolve) => {
+    source.onmessage = (e) => {
+      const frame = JSON.parse(e.data)
+      if (onFrame) onFrame(frame)
+      if (frame.type === 'done') {
+        source.close()
+        resolve(frame)
+      }
+    }
+  })
+  return { source, done }
+}
+
+// The most recent running job of a kind starting with `prefix`, e.g. one started from another page
+export async function findRunningJob(prefix, apiBaseUrl = '/api') {
+  const res = await fetch(`${apiBaseUrl}/jobs?limit=5`).catch(() => null)
+  if (!res || !res.ok) return null
+  const { jobs } = await res.json()
+  return jobs.find(j => j.status === 'running' && j.kind.startsWith(prefix)) || null
+}
@@ -0,0 +1,95 @@
+// Agent file uploads: plain multipart for small files, resumable for large ones
+
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+const CHUNK_SIZE = 4 * 1024 * 1024
+const MAX_RETRIES = 5
+
+function encodeMetadata(metadata) {
+  return Object.entries(metadata)
+    .map(([key, value]) => `${key} ${btoa(unescape(encodeURIComponent(value)))}`)
+    .join(',')
+}
+
+// SHA-256 of the file, or null where WebCrypto is unavailable (plain-HTTP LAN access)
+async function hashFile(file) {
+  if (!globalThis.crypto?.subtle) return null
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('')
+}
+
+async function resumableUpload(file, agent, apiBaseUrl) {
+  const metadata = { filename: file.name, agent }
+  const sha256 = await hashFile(file)
+  if (sha256) metadata.sha256 = sha256
+
+  const createRes = await fetch(`${apiBaseUrl}/upload/resumable`, {
+    method: 'POST',
+    headers: {
+      'Upload-Length': String(file.size),
+      'Upload-Metadata': encodeMetadata(metadata)
+    }
+  })
+  // The server already has this file: nothing to send
+  if (createRes.status === 200) return createRes.json()
+  if (!createRes.ok) {
+    const err = await createRes.json()
+    throw new Error(err.detail || 'Upload failed')
+  }
+  // Location is an absolute API path (/api/...); keep the configured base for it
+  const uploadUrl = `${apiBaseUrl}${createRes.headers.get('Location').replace(/^\/api/, '')}`
+
+  let offset = 0
+  let retries = 0
+  const backOff = () => new Promise(resolve => setTimeout(resolve, 1000 * ++retries))
+  while (true) {
+    try {
+      const res = await fetch(uploadUrl, {
+        method: 'PATCH',
+        headers: {
+          'Content-Type': 'application/offset+octet-stream',
+          'Upload-Offset': String(offset)
+        },
+        body: file.slice(offset, offset + CHUNK_SIZE)
+      })
+      if (res.status === 200) return await res.json()
+      if (res.status === 204) {
+        offset = Number(res.headers.get('Upload-Offset'))
+        retries = 0
+        continue
+      }
+      const err = await res.json().catch(() => ({}))
+      if (res.status !== 409 || retries >= MAX_RETRIES) {
+        throw new Error(err.detail || 'Upload failed')
+      }
+      // Offset mismatch, or another PATCH still holds the upload: back off like a network error
+      await backOff()
+    } catch (e) {
+      if (!(e instanceof TypeError) || retries >= MAX_RETRIES) throw e
+      // Network error: back off, then ask the server where to resume
+      await backOff()
+    }
+    const head = await fetch(uploadUrl, { method: 'HEAD' })
+    if (!head.ok) throw new Error('Upload expired')
+    offset = Number(head.headers.get('Upload-Offset'))
+  }
+}
+
+export async function uploadAgentFile(file, agent, apiBaseUrl = '/api') {
+  if (file.size > RESUMABLE_THRESHOLD) {
+    return resumableUpload(file, agent, apiBaseUrl)
+  }
+
+  const formData = new FormData()
+  formData.append('file', file)
+  formData.append('agent', agent)
+
+  const res = await fetch(`${apiBaseUrl}/upload`, {
+    method: 'POST',
+    body: formData
+  })
+  if (!res.ok) {
+    const err = await res.json()
+    throw new Error(err.detail || 'Upload failed')
+  }
+  return res.json()
+}
@@ -0,0 +1,35 @@
+"""Test setup for the backend: a throwaway HOME and no Docker daemon needed.
+
+main.py resolves its data paths from HOME and connects to Docker at import
+time, so both are arranged before it is imported.
+"""
+
+import os
+import sys
+import tempfile
+
+import docker
+import pytest
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="dgx-web-ui-test-")
+os.environ.setdefault("GPU_COLLECTOR", "fake")
+
+
+class OfflineDockerClient:
+    """Stands in for docker.from_env(); tests here never talk to Docker"""
+
+
+docker.from_env = lambda **kwargs: OfflineDockerClient()
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+
+@pytest.fixture(scope="session")
+def main():
+    import main as backend
+    return backend
+
+
+@pytest.fixture
+def client(main):
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)
@@ -0,0 +1,35 @@
+import os
+
+
+def upload(client, data: bytes, name: str = "photo.png") -> dict:
+    res = client.post("/api/upload", files={"file": (name, data, "image/png")}, data={"agent": "sparky"})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_same_file_uploaded_twice_survives_one_delete(client):
+    data = b"\x89PNG same bytes for both uploads"
+    first = upload(client, data)
+    second = upload(client, data)
+
+    assert second["deduplicated"]
+    assert first["path"] != second["path"]
+
+    res = client.delete(f"/api/uploads/sparky/{first['filename']}")
+    assert res.status_code == 200, res.text
+
+    assert not os.path.exists(first["path"])
+    assert os.path.exists(second["path"])
+    with open(second["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_blob_removed_with_last_name(client, main):
+    data = b"\x89PNG only referenced here"
+    stored = upload(client, data)
+    blob = main.blob_path("sparky", stored["sha256"])
+    assert os.path.exists(blob)
+
+    res = client.delete(f"/api/uploads/sparky/{stored['filename']}")
+    assert res.status_code == 200, res.text
+    assert not os.path.exists(blob)